@@ -0,0 +1,72 @@
+"""
+Сравнение двух прогонов bench.run. Завершается с кодом 1, если в новом
+прогоне RPS упал или p95/p99 выросли сильнее допуска.
+
+    python -m bench.compare bench/results/base.json bench/results/new.json
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+
+def load(path: Path) -> Tuple[dict, Dict[Tuple[str, str], dict]]:
+    report = json.loads(path.read_text())
+    return report['meta'], {(r['scenario'], r['mode']): r for r in report['results']}
+
+
+def change(base: float, new: float) -> float:
+    return (new - base) / base if base else 0.0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Сравнение двух прогонов бенчмарка')
+    parser.add_argument('base', type=Path)
+    parser.add_argument('new', type=Path)
+    parser.add_argument('--rps-tolerance', type=float, default=0.10, help='допустимое падение RPS')
+    parser.add_argument(
+        '--latency-tolerance', type=float, default=0.15, help='допустимый рост p95/p99'
+    )
+    args = parser.parse_args()
+
+    base_meta, base = load(args.base)
+    new_meta, new = load(args.new)
+    print(f"base: {base_meta.get('commit')} {base_meta.get('label') or ''} ({base_meta['date']})")
+    print(f"new:  {new_meta.get('commit')} {new_meta.get('label') or ''} ({new_meta['date']})")
+    for field in ('concurrency', 'requests', 'redis', 'stub'):
+        if base_meta.get(field) != new_meta.get(field):
+            print(f'warning: runs differ in {field}: {base_meta.get(field)} vs {new_meta.get(field)}')
+
+    regressions: List[str] = []
+    print(f"\n{'scenario':<14} {'mode':<6} {'rps':>16} {'p95 ms':>18} {'p99 ms':>18}")
+    for key in sorted(base.keys() & new.keys()):
+        b, n = base[key], new[key]
+        rps, p95, p99 = change(b['rps'], n['rps']), change(b['p95_ms'], n['p95_ms']), change(b['p99_ms'], n['p99_ms'])
+        print(
+            f'{key[0]:<14} {key[1]:<6} '
+            f"{n['rps']:>8.1f} ({rps:+6.1%}) {n['p95_ms']:>8.2f} ({p95:+6.1%}) {n['p99_ms']:>8.2f} ({p99:+6.1%})"
+        )
+        if rps < -args.rps_tolerance:
+            regressions.append(f'{key[0]}/{key[1]}: rps {rps:+.1%}')
+        for name, delta in (('p95', p95), ('p99', p99)):
+            if delta > args.latency_tolerance:
+                regressions.append(f'{key[0]}/{key[1]}: {name} {delta:+.1%}')
+        if n['errors'] > b['errors']:
+            regressions.append(f"{key[0]}/{key[1]}: errors {b['errors']} -> {n['errors']}")
+
+    missing = sorted(base.keys() - new.keys())
+    if missing:
+        print(f'\nmissing in new run: {", ".join("/".join(k) for k in missing)}')
+
+    if regressions:
+        print('\nRegressions:')
+        for line in regressions:
+            print(f'  {line}')
+        return 1
+    print('\nNo regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
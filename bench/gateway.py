@@ -0,0 +1,81 @@
+"""
+Запуск шлюза для бенчмарка в отдельном процессе.
+
+При BENCH_REDIS=fake Redis подменяется in-memory реализацией из пакета
+fakeredis (для Lua-скриптов нужен ещё lupa). Иначе используется REDIS_URL.
+fakeredis реализует не весь Lua API Redis: если скрипт шлюза вызывает
+недоступную функцию, он падает, и шлюз уходит в запасной путь, которого
+в продакшене нет, — об этом бенчмарк предупреждает при старте.
+
+Запуск: python -m bench.gateway --port 9000
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+
+import uvicorn
+
+
+logger = logging.getLogger('bench')
+
+LUA_CALL = re.compile(r'\bredis\.(\w+)\s*\(')
+
+
+def use_fake_redis():
+    """ Направляет общий пул соединений шлюза в in-memory сервер fakeredis """
+    import fakeredis
+    import redis.asyncio as aioredis
+    from fakeredis.aioredis import FakeConnection
+
+    server = fakeredis.FakeServer()
+
+    def from_url(url, **kwargs):
+        kwargs.pop('health_check_interval', None)
+        return aioredis.ConnectionPool(connection_class=FakeConnection, server=server, **kwargs)
+
+    aioredis.ConnectionPool.from_url = staticmethod(from_url)
+    return server
+
+
+def check_lua(server) -> None:
+    """ Предупреждает о функциях redis.* из скриптов шлюза, которых нет в Lua fakeredis """
+    import fakeredis
+    from redis.commands.core import AsyncScript
+
+    used = set()
+    for name, module in list(sys.modules.items()):
+        if name.startswith('src.'):
+            for value in vars(module).values():
+                if isinstance(value, AsyncScript):
+                    script = value.script
+                    if isinstance(script, bytes):
+                        script = script.decode()
+                    used.update(LUA_CALL.findall(script))
+
+    client = fakeredis.FakeRedis(server=server)
+    missing = [
+        name for name in sorted(used) if client.eval(f'return type(redis.{name})', 0) == b'nil'
+    ]
+    if missing:
+        logger.warning(
+            f'fakeredis Lua lacks redis.{", redis.".join(missing)}: scripts using them fail '
+            f'and the gateway falls back; run with --redis <url> to measure production paths'
+        )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Шлюз для бенчмарка')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    args = parser.parse_args()
+
+    server = use_fake_redis() if os.getenv('BENCH_REDIS') == 'fake' else None
+
+    from src.main import app
+
+    if server is not None:
+        check_lua(server)
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning', access_log=False)
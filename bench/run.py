@@ -0,0 +1,333 @@
+"""
+Нагрузочный прогон шлюза против локальных заглушек апстримов.
+
+Поднимает заглушки (bench.stubs) и шлюз (bench.gateway) отдельными
+процессами, прогоняет каждый маршрут /api/* с заданной параллельностью
+на холодном и прогретом кэше и сохраняет RPS, p50/p95/p99 и память
+шлюза в JSON. Два таких файла сравнивает bench.compare.
+
+    python -m bench.run --concurrency 32 --requests 2000
+    python -m bench.run --redis redis://localhost:6379/15 --routes words stats
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from itertools import count
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / 'bench' / 'results'
+
+BATCH_SIZE = 10
+
+
+@dataclass
+class Scenario:
+    """ Маршрут и способ построить запрос по идентификатору пользователя """
+    name: str
+    method: str
+    path: str
+    params: Callable[[int], dict]
+    body: Optional[Callable[[int], dict]] = None
+    cached: bool = True
+
+
+def batch_ids(user_id: int) -> List[int]:
+    return [user_id * BATCH_SIZE + k for k in range(BATCH_SIZE)]
+
+
+SCENARIOS = [
+    Scenario('words', 'GET', '/api/words', lambda i: {'user_id': i}),
+    Scenario('search', 'GET', '/api/words/search', lambda i: {'word': f'w{i}', 'user_id': i}),
+    Scenario('autocomplete', 'GET', '/api/words/autocomplete', lambda i: {'prefix': f'word-{i % 10}'}),
+    Scenario('stats', 'GET', '/api/words/stats', lambda i: {'user_id': i}),
+    Scenario('stats_batch', 'GET', '/api/words/stats/batch', lambda i: {'user_ids': batch_ids(i)}),
+    Scenario('user', 'GET', '/api/users', lambda i: {'user_id': i, 'target_field': 'nickname'}),
+    Scenario(
+        'users_batch', 'GET', '/api/users/batch',
+        lambda i: {'user_ids': batch_ids(i), 'target_field': 'nickname'}
+    ),
+    Scenario('due_to', 'GET', '/api/due_to', lambda i: {'user_id': i}),
+    Scenario('due_to_batch', 'GET', '/api/due_to/batch', lambda i: {'user_ids': batch_ids(i)}),
+    Scenario('user_exists', 'GET', '/api/users', lambda i: {'user_id': i}, cached=False),
+    Scenario('nicknames', 'GET', '/api/nicknames', lambda i: {'nickname': f'nick{i}'}, cached=False),
+    Scenario(
+        'save_word', 'POST', '/api/words', lambda i: {},
+        body=lambda i: {'user_id': i, 'word': f'w{i}', 'translation': 't'}, cached=False
+    ),
+    Scenario(
+        'delete_word', 'DELETE', '/api/words', lambda i: {'user_id': i, 'word_id': 1}, cached=False
+    ),
+]
+
+
+@dataclass
+class Result:
+    scenario: str
+    mode: str
+    requests: int
+    errors: int
+    seconds: float
+    rps: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    rss_mb: Optional[float]
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(int(len(ordered) * q / 100), len(ordered) - 1)]
+
+
+def rss_mb(pid: int) -> Optional[float]:
+    """ Резидентная память процесса (только Linux) """
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        return None
+    return None
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def wait_ready(url: str, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f'{url} did not become ready in {timeout}s')
+
+
+async def drive(
+        client: httpx.AsyncClient,
+        scenario: Scenario,
+        ids: Iterator[int],
+        total: int,
+        concurrency: int
+) -> tuple:
+    """ Отправляет `total` запросов не больше `concurrency` одновременно """
+    latencies: List[float] = []
+    errors = 0
+    issued = count()
+
+    async def worker():
+        nonlocal errors
+        while next(issued) < total:
+            user_id = next(ids)
+            started = time.perf_counter()
+            try:
+                response = await client.request(
+                    scenario.method,
+                    scenario.path,
+                    params=scenario.params(user_id),
+                    json=scenario.body(user_id) if scenario.body else None,
+                )
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return sorted(latencies), errors, time.perf_counter() - started
+
+
+async def run_scenario(
+        client: httpx.AsyncClient,
+        scenario: Scenario,
+        mode: str,
+        args: argparse.Namespace,
+        gateway_pid: int,
+        offset: int
+) -> Result:
+    if mode == 'warm':
+        # Прогрев: каждый идентификатор рабочего набора запрашивается один раз
+        warm = range(1, args.warm_ids + 1)
+        await drive(client, scenario, iter(warm), len(warm), args.concurrency)
+        ids = (1 + i % args.warm_ids for i in count())
+    else:
+        # Холодный кэш: идентификаторы не повторяются ни внутри прогона, ни между сценариями
+        ids = count(offset)
+
+    latencies, errors, seconds = await drive(client, scenario, ids, args.requests, args.concurrency)
+    ms = [latency * 1000 for latency in latencies]
+    return Result(
+        scenario=scenario.name,
+        mode=mode,
+        requests=len(ms),
+        errors=errors,
+        seconds=round(seconds, 3),
+        rps=round(len(ms) / seconds, 1) if seconds else 0.0,
+        p50_ms=round(percentile(ms, 50), 2),
+        p95_ms=round(percentile(ms, 95), 2),
+        p99_ms=round(percentile(ms, 99), 2),
+        max_ms=round(ms[-1], 2) if ms else 0.0,
+        rss_mb=rss_mb(gateway_pid),
+    )
+
+
+def start_processes(args: argparse.Namespace) -> tuple:
+    stub_env = {
+        **os.environ,
+        'STUB_LATENCY_MS': str(args.latency_ms),
+        'STUB_JITTER_MS': str(args.jitter_ms),
+        'STUB_WORDS': str(args.words),
+        'STUB_ERROR_RATE': str(args.error_rate),
+    }
+    gateway_env = {
+        **os.environ,
+        'PYTHONPATH': str(ROOT),
+        'THIS_HOST': '127.0.0.1',
+        'THIS_PORT': str(args.gateway_port),
+        'DATABASE_HOST': '127.0.0.1',
+        'DATABASE_PORT': str(args.stub_port),
+        'DATABASE_PREFIX': '/db',
+        'DATABASE_BULK_STATS_PATH': '/words/stats/bulk' if args.bulk else '',
+        'DATABASE_BULK_USERS_PATH': '/users/bulk' if args.bulk else '',
+        'DATABASE_PUBLIC_WORDS_PATH': '/words/public',
+        'PAYMENT_HOST': '127.0.0.1',
+        'PAYMENT_PORT': str(args.stub_port),
+        'PAYMENT_HANDLER_PREFIX': '/pay',
+        'PAYMENT_WEBHOOK_PREFIX': '/webhook',
+        'PAYMENT_BULK_DUE_TO_PATH': '/due_to/bulk' if args.bulk else '',
+        'RATE_LIMIT': '1' if args.rate_limit else '0',
+        'MAX_IN_FLIGHT': '0',
+        'SLOW_REQUEST_MS': '0',
+    }
+    if args.redis == 'fake':
+        gateway_env['BENCH_REDIS'] = 'fake'
+    else:
+        gateway_env['REDIS_URL'] = args.redis
+
+    stubs = subprocess.Popen(
+        [sys.executable, '-m', 'bench.stubs', '--port', str(args.stub_port)],
+        cwd=ROOT, env=stub_env,
+    )
+    gateway = subprocess.Popen(
+        [sys.executable, '-m', 'bench.gateway', '--port', str(args.gateway_port)],
+        cwd=ROOT, env=gateway_env,
+    )
+    return stubs, gateway
+
+
+async def benchmark(args: argparse.Namespace, gateway_pid: int) -> List[Result]:
+    await wait_ready(f'http://127.0.0.1:{args.stub_port}/db/health')
+    await wait_ready(f'http://127.0.0.1:{args.gateway_port}/metrics')
+
+    scenarios = [s for s in SCENARIOS if not args.routes or s.name in args.routes]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = []
+    async with httpx.AsyncClient(
+            base_url=f'http://127.0.0.1:{args.gateway_port}', limits=limits, timeout=30.0
+    ) as client:
+        for index, scenario in enumerate(scenarios):
+            modes = ('cold', 'warm') if scenario.cached else ('direct',)
+            for mode in modes:
+                offset = 10_000_000 * (index + 1)
+                result = await run_scenario(client, scenario, mode, args, gateway_pid, offset)
+                results.append(result)
+                print(
+                    f'{result.scenario:<14} {result.mode:<6} {result.rps:>9.1f} rps  '
+                    f'p50 {result.p50_ms:>7.2f}  p95 {result.p95_ms:>7.2f}  '
+                    f'p99 {result.p99_ms:>7.2f} ms  errors {result.errors:<5} '
+                    f'rss {result.rss_mb} MB',
+                    flush=True,
+                )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон шлюза')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000, help='запросов на сценарий и режим')
+    parser.add_argument('--warm-ids', type=int, default=100, help='рабочий набор прогретого кэша')
+    parser.add_argument('--routes', nargs='*', help='только эти сценарии')
+    parser.add_argument('--redis', default='fake', help='"fake" (fakeredis) или URL Redis')
+    parser.add_argument('--latency-ms', type=float, default=5)
+    parser.add_argument('--jitter-ms', type=float, default=2)
+    parser.add_argument('--words', type=int, default=50, help='размер словаря в ответе /words')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--bulk', action='store_true', help='включить пакетные маршруты апстримов')
+    parser.add_argument('--rate-limit', action='store_true', help='не отключать лимиты частоты')
+    parser.add_argument('--stub-port', type=int, default=9100)
+    parser.add_argument('--gateway-port', type=int, default=9000)
+    parser.add_argument('--label', help='метка прогона в имени файла')
+    parser.add_argument('--output', type=Path, help='куда сохранить JSON с результатами')
+    args = parser.parse_args()
+
+    stubs, gateway = start_processes(args)
+    try:
+        results = asyncio.run(benchmark(args, gateway.pid))
+    finally:
+        for process in (gateway, stubs):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    commit = git_commit()
+    report = {
+        'meta': {
+            'commit': commit,
+            'label': args.label,
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'redis': 'fakeredis' if args.redis == 'fake' else args.redis,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'warm_ids': args.warm_ids,
+            'bulk': args.bulk,
+            'stub': {
+                'latency_ms': args.latency_ms,
+                'jitter_ms': args.jitter_ms,
+                'words': args.words,
+                'error_rate': args.error_rate,
+            },
+            'rss_first_mb': results[0].rss_mb if results else None,
+            'rss_last_mb': results[-1].rss_mb if results else None,
+        },
+        'results': [asdict(result) for result in results],
+    }
+
+    output = args.output
+    if output is None:
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = RESULTS_DIR / f'{args.label or commit or "run"}-{stamp}.json'
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f'Saved {output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+Заглушки database- и payment-сервисов для нагрузочных прогонов.
+
+Одно приложение обслуживает оба префикса (/db и /pay). Задержка, размер
+ответа и доля ошибок задаются переменными окружения:
+
+    STUB_LATENCY_MS  средняя задержка ответа (по умолчанию 5)
+    STUB_JITTER_MS   разброс задержки, равномерный ± (по умолчанию 2)
+    STUB_WORDS       число слов в словаре пользователя (по умолчанию 50)
+    STUB_ERROR_RATE  доля ответов 500 (по умолчанию 0)
+    STUB_PUBLIC_USERS  чьи публичные слова отдаёт /words/public (по умолчанию 100)
+    STUB_SEED        seed генератора случайных чисел
+
+Запуск: python -m bench.stubs --port 9100
+"""
+import argparse
+import asyncio
+import os
+import random
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+DATABASE_PREFIX = '/db'
+PAYMENT_PREFIX = '/pay'
+
+LATENCY = float(os.getenv('STUB_LATENCY_MS', 5)) / 1000
+JITTER = float(os.getenv('STUB_JITTER_MS', 2)) / 1000
+WORDS = int(os.getenv('STUB_WORDS', 50))
+ERROR_RATE = float(os.getenv('STUB_ERROR_RATE', 0))
+PUBLIC_USERS = int(os.getenv('STUB_PUBLIC_USERS', 100))
+
+rng = random.Random(int(os.getenv('STUB_SEED', 42)))
+
+app = FastAPI()
+
+
+def word(user_id: int, word_id: int) -> dict:
+    return {
+        'word_id': word_id,
+        'user_id': user_id,
+        'word': f'word-{word_id}',
+        'part_of_speech': 'noun',
+        'translation': f'translation-{word_id}',
+        'is_public': word_id % 3 == 0,
+        'context': 'Lorem ipsum dolor sit amet, consectetur adipiscing elit.',
+    }
+
+
+def stats(user_id: int) -> dict:
+    return {'user_id': user_id, 'total': WORDS, 'public': WORDS // 3, 'learned': WORDS // 2}
+
+
+def due_to(user_id: int) -> dict:
+    return {'user_id': user_id, 'until': '2030-01-01T00:00:00+03:00', 'is_active': True}
+
+
+@app.middleware('http')
+async def inject_latency_and_errors(request: Request, call_next):
+    delay = LATENCY + rng.uniform(-JITTER, JITTER)
+    if delay > 0:
+        await asyncio.sleep(delay)
+    if ERROR_RATE and rng.random() < ERROR_RATE:
+        return JSONResponse({'detail': 'injected failure'}, status_code=500)
+    return await call_next(request)
+
+
+@app.get(DATABASE_PREFIX + '/health')
+async def health():
+    return {'status': 'ok'}
+
+
+@app.get(DATABASE_PREFIX + '/words')
+async def get_words(user_id: int):
+    return {str(i): word(user_id, i) for i in range(WORDS)}
+
+
+@app.post(DATABASE_PREFIX + '/words')
+async def save_word(request: Request):
+    # Как database-сервис: возвращает сохранённое слово с присвоенным word_id
+    payload = await request.json()
+    return {**payload, 'word_id': WORDS + rng.randrange(1_000_000)}
+
+
+@app.delete(DATABASE_PREFIX + '/words')
+async def delete_word():
+    return 200
+
+
+@app.get(DATABASE_PREFIX + '/words/public')
+async def public_words():
+    # Публичные слова первых PUBLIC_USERS пользователей — для индекса поиска шлюза
+    return [
+        word(user_id, word_id)
+        for user_id in range(PUBLIC_USERS) for word_id in range(WORDS) if word_id % 3 == 0
+    ]
+
+
+@app.get(DATABASE_PREFIX + '/words/search')
+async def search_words(word: str, user_id: str = 'null'):
+    # Та же форма {word_id: слово}, что у поиска по индексу шлюза
+    return {
+        str(i): {'word_id': i, 'word': word, 'user_id': i, 'translation': f'translation-{i}'}
+        for i in range(5)
+    }
+
+
+@app.get(DATABASE_PREFIX + '/words/stats')
+async def get_stats(user_id: int):
+    return stats(user_id)
+
+
+@app.post(DATABASE_PREFIX + '/words/stats/bulk')
+async def get_stats_bulk(request: Request):
+    user_ids = (await request.json())['user_ids']
+    return {str(user_id): stats(user_id) for user_id in user_ids}
+
+
+@app.get(DATABASE_PREFIX + '/users')
+async def get_user(user_id: int, target_field: str):
+    return {'user_id': user_id, target_field: f'{target_field}-{user_id}'}
+
+
+@app.post(DATABASE_PREFIX + '/users/bulk')
+async def get_users_bulk(request: Request):
+    payload = await request.json()
+    field = payload.get('target_field')
+    return {str(user_id): {'user_id': user_id, field: f'{field}-{user_id}'} for user_id in payload['user_ids']}
+
+
+@app.post(DATABASE_PREFIX + '/users')
+async def create_user():
+    return {'status': 'ok'}
+
+
+@app.get(DATABASE_PREFIX + '/user_exists')
+async def user_exists(user_id: int):
+    return user_id % 2 == 0
+
+
+@app.get(DATABASE_PREFIX + '/nickname_exists')
+async def nickname_exists(nickname: str):
+    return len(nickname) % 2 == 0
+
+
+@app.get(PAYMENT_PREFIX + '/due_to')
+async def get_due_to(user_id: int):
+    return due_to(user_id)
+
+
+@app.post(PAYMENT_PREFIX + '/due_to/bulk')
+async def get_due_to_bulk(request: Request):
+    user_ids = (await request.json())['user_ids']
+    return {str(user_id): due_to(user_id) for user_id in user_ids}
+
+
+@app.post(PAYMENT_PREFIX + '/add')
+async def add_payment():
+    return {'status': 'ok'}
+
+
+@app.get(PAYMENT_PREFIX + '/link')
+async def payment_link(user_id: int):
+    return f'https://pay.example/{user_id}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Заглушки апстримов для бенчмарка')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level='warning', access_log=False)
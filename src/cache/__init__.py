@@ -0,0 +1,44 @@
+__all__ = [
+    'SingleFlight',
+    'BloomFilter',
+    'LocalCache',
+    'Cached',
+    'Deferred',
+    'Passthrough',
+    'redis',
+    'close_redis',
+    'local_cache',
+    'flight',
+    'get_blob',
+    'get_many',
+    'set_blob',
+    'is_empty',
+    'negative',
+    'count_lookup',
+    'read_through',
+    'read_through_etag',
+    'cached_etag',
+    'etag_matches',
+    'drain_refreshes',
+    'read_many',
+    'relay',
+    'invalidate',
+    'invalidation_listener',
+    'patch_word',
+    'nicknames_bloom',
+    'users_bloom',
+    'bloom_filters',
+]
+
+from .batch import read_many
+from .bloom import BloomFilter, nicknames_bloom, users_bloom, bloom_filters
+from .client import redis, close_redis
+from .invalidation import invalidate, invalidation_listener
+from .local import LocalCache
+from .patch import patch_word
+from .singleflight import SingleFlight
+from .store import (
+    Cached, Deferred, local_cache, flight, get_blob, get_many, set_blob, is_empty, negative,
+    count_lookup, read_through, read_through_etag, cached_etag, etag_matches, drain_refreshes
+)
+from .stream import Passthrough, relay
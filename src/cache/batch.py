@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from json import dumps
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+
+from src.config import CachePolicy
+from src.upstream import CircuitOpenError, is_unavailable
+from .store import Cached, count_lookup, flight, get_many, revalidate, is_empty
+
+logger = logging.getLogger('gateway')
+
+
+def batch_item(reply: Any) -> bytes:
+    """
+    Элемент пакетного ответа со статусом по одному идентификатору.
+    Тело из кэша или апстрима вставляется как есть, без разбора.
+    """
+    if isinstance(reply, CircuitOpenError):
+        reply = reply.as_http()
+    if isinstance(reply, HTTPException):
+        return dumps({'status': 'error', 'code': reply.status_code, 'error': reply.detail}).encode()
+    if isinstance(reply, BaseException):
+        return dumps({'status': 'error', 'code': 500, 'error': str(reply)}).encode()
+    if reply is None or is_empty(reply):
+        return b'{"status": "not_found", "data": null}'
+    return b'{"status": "fetched", "data": ' + reply + b'}'
+
+
+async def read_many(
+        ids: Iterable[Any],
+        key_for: Callable[[Any], str],
+        fetch_one: Callable[[Any], Awaitable[bytes]],
+        policy: CachePolicy,
+        concurrency: int,
+        tags: Optional[Callable[[Any], Iterable[str]]] = None,
+        fetch_bulk: Optional[Callable[[List[Any]], Awaitable[Dict[Any, Optional[bytes]]]]] = None
+) -> bytes:
+    """
+    Пакетный аналог read_through. Закэшированные записи читаются одним
+    конвейерным проходом по Redis, промахи — одним вызовом `fetch_bulk`
+    (если у апстрима есть пакетный маршрут), иначе параллельно через
+    `fetch_one`, но не больше `concurrency` запросов одновременно.
+    Возвращает готовый JSON-объект {id: {status, data}}. Если апстрим
+    недоступен, истёкшие записи отдаются со статусом `fallback`.
+    """
+    ids = list(dict.fromkeys(ids))
+    keys = {ident: key_for(ident) for ident in ids}
+    results: Dict[Any, bytes] = {}
+    fallback: Dict[Any, Cached] = {}
+
+    for ident, entry in (await get_many(keys, policy, tags)).items():
+        if entry.expired:
+            fallback[ident] = entry
+            continue
+        if entry.stale:
+            count_lookup(keys[ident], 'stale')
+            revalidate(keys[ident], lambda ident=ident: fetch_one(ident))
+        else:
+            count_lookup(keys[ident], 'hit')
+        results[ident] = b'{"status": "hit", "data": ' + entry.value + b'}'
+
+    missing = [ident for ident in ids if ident not in results]
+    for ident in missing:
+        count_lookup(keys[ident], 'miss')
+    if missing and fetch_bulk is not None:
+        try:
+            fetched = await fetch_bulk(missing)
+        except Exception as e:
+            logger.warning(f'Bulk fetch of {len(missing)} entries failed, fanning out: {e}')
+        else:
+            for ident in missing:
+                results[ident] = batch_item(fetched.get(ident))
+            missing = []
+
+    if missing:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(ident):
+            async with semaphore:
+                return await flight.do(keys[ident], lambda: fetch_one(ident))
+
+        replies = await asyncio.gather(
+            *(fetch(ident) for ident in missing), return_exceptions=True
+        )
+        for ident, reply in zip(missing, replies):
+            if ident in fallback and isinstance(reply, BaseException) and is_unavailable(reply):
+                count_lookup(keys[ident], 'fallback')
+                results[ident] = b'{"status": "fallback", "data": ' + fallback[ident].value + b'}'
+            else:
+                results[ident] = batch_item(reply)
+
+    return b'{' + b', '.join(
+        dumps(str(ident)).encode() + b': ' + results[ident] for ident in ids
+    ) + b'}'
@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from json import dumps, loads
+from typing import Awaitable, Callable, Iterable, List, Optional, Set
+
+from src.config import config, BloomConfig
+from src.upstream import database
+from .client import redis, CACHE_ERRORS
+
+logger = logging.getLogger('gateway')
+
+Source = Callable[[], Awaitable[Iterable[str]]]
+
+
+class BloomFilter:
+    """
+    Фильтр Блума для проверок существования без похода в database-сервис.
+
+    Биты лежат в строке Redis `bloom:{name}:{m}:{k}` (SETBIT), а у каждой
+    реплики — её копия в памяти: ответ «точно нет» даётся локально.
+    Добавления пишутся в Redis и рассылаются остальным репликам через
+    канал `gateway:bloom:{name}`; раз в `refresh_interval` копия сверяется
+    с Redis целиком. Фильтру доверяют, только когда он построен из полного
+    списка (`source`) и в Redis стоит отметка `:ready`; до этого, как и при
+    потере подписки или неудачной записи добавления в Redis, он на всё
+    отвечает «может быть». Не записанные в Redis элементы дописываются
+    при восстановлении связи, до следующего чтения копии.
+
+    Отметка `:ready` живёт `rebuild_interval`, после чего одна из реплик
+    заново наполняет фильтр из `source`. Так записи, созданные в обход
+    шлюза или потерянные между записью в БД и `add`, получают «точно нет»
+    не дольше `rebuild_interval + refresh_interval`.
+    """
+
+    def __init__(self, name: str, settings: BloomConfig, source: Optional[Source] = None):
+        self.name = name
+        self.settings = settings
+        self.source = source
+        n, p = max(settings.capacity, 1), settings.error_rate
+        self.size = int(math.ceil(-n * math.log(p) / math.log(2) ** 2 / 8)) * 8
+        self.hashes = max(1, round(self.size / n * math.log(2)))
+        self.key = f'bloom:{name}:{self.size}:{self.hashes}'
+        self.ready_key = f'{self.key}:ready'
+        self.channel = f'gateway:bloom:{name}'
+        self.ready = False
+        self.refreshed_at: Optional[float] = None
+        self._bits = bytearray(self.size // 8)
+        self._unsynced: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def positions(self, item: str) -> List[int]:
+        # Двойное хеширование: k позиций из двух 64-битных половин одного дайджеста
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    @staticmethod
+    def _set_bits(bits: bytearray, positions: Iterable[int]) -> None:
+        for pos in positions:
+            bits[pos >> 3] |= 0x80 >> (pos & 7)
+
+    def has_bits(self, item: str) -> bool:
+        """ Все биты элемента уже стоят в локальной копии """
+        bits = self._bits
+        return all(bits[pos >> 3] & (0x80 >> (pos & 7)) for pos in self.positions(item))
+
+    def might_contain(self, item: str) -> bool:
+        """ False — элемента точно нет; True — может быть (или фильтру ещё нельзя верить) """
+        return not self.ready or self.has_bits(item)
+
+    async def add(self, item: str) -> None:
+        self._set_bits(self._bits, self.positions(item))
+        if not self.settings.enabled:
+            return
+        try:
+            await self._write([item])
+        except CACHE_ERRORS as e:
+            # Бит есть только в локальной копии, и refresh его бы затёр:
+            # пока он не записан в Redis, фильтру верить нельзя
+            logger.warning(f'Bloom filter {self.name}: add failed: {e}')
+            self._unsynced.add(item)
+            self.ready = False
+
+    async def _write(self, items: Iterable[str]) -> None:
+        """ Ставит биты элементов в Redis и рассылает их остальным репликам """
+        async with redis.pipeline(transaction=False) as pipe:
+            for item in items:
+                for pos in self.positions(item):
+                    pipe.setbit(self.key, pos, 1)
+                pipe.publish(self.channel, dumps({'item': item}))
+            await pipe.execute()
+
+    async def _sync(self) -> None:
+        if self._unsynced:
+            items = list(self._unsynced)
+            await self._write(items)
+            self._unsynced.difference_update(items)
+
+    # --- синхронизация с Redis ---
+
+    async def start(self) -> None:
+        if self._task is None and self.settings.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f'Bloom filter {self.name}: sync failed: {e}')
+            await asyncio.sleep(self.settings.retry_delay)
+
+    async def _listen(self) -> None:
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self.channel)
+            # Копия снимается после подписки: добавления во время чтения не теряются
+            await self.refresh()
+            refresh_at = time.monotonic() + self.settings.refresh_interval
+            while True:
+                if self._unsynced:
+                    await self.refresh()
+                    refresh_at = time.monotonic() + self.settings.refresh_interval
+                if time.monotonic() >= refresh_at:
+                    await self.refresh()
+                    refresh_at = time.monotonic() + self.settings.refresh_interval
+                message = await pubsub.get_message(timeout=1.0)
+                if message is None or message.get('type') != 'message':
+                    continue
+                try:
+                    self._set_bits(self._bits, self.positions(loads(message['data'])['item']))
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f'Malformed bloom filter event: {message["data"]!r}')
+        finally:
+            # Без подписки можно пропустить добавления других реплик
+            self.ready = False
+            await pubsub.aclose()
+
+    async def refresh(self) -> None:
+        # Сначала дописываем то, что не удалось добавить: иначе копия из Redis его затрёт
+        await self._sync()
+        if not await redis.exists(self.ready_key):
+            lock = f'{self.key}:build'
+            if self.source is None or not await redis.set(
+                    lock, config.host, nx=True, ex=self.settings.build_lock
+            ):
+                self.ready = False
+                return
+            try:
+                await self._build()
+            finally:
+                # Иначе следующая перестройка ждала бы истечения блокировки
+                await redis.delete(lock)
+
+        bits = await redis.get(self.key) or b''
+        self._bits = bytearray(bits[:len(self._bits)].ljust(len(self._bits), b'\0'))
+        self.ready = True
+        self.refreshed_at = time.time()
+
+    async def _build(self) -> None:
+        """ Наполнение из полного списка; биты, добавленные тем временем, сохраняются """
+        items = list(await self.source())
+        bits = bytearray(len(self._bits))
+
+        def fill():
+            for item in items:
+                self._set_bits(bits, self.positions(item))
+
+        await asyncio.to_thread(fill)
+        tmp = f'{self.key}:tmp'
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.set(tmp, bytes(bits))
+            pipe.bitop('OR', self.key, self.key, tmp)
+            pipe.delete(tmp)
+            pipe.set(self.ready_key, 1, ex=self.settings.rebuild_interval or None)
+            await pipe.execute()
+        logger.info(f'Bloom filter {self.name}: built from {len(items)} items')
+
+    def snapshot(self) -> dict:
+        return {
+            'ready': self.ready,
+            'bits': self.size,
+            'hashes': self.hashes,
+            'refreshed_at': self.refreshed_at,
+        }
+
+
+def listing(path: Optional[str]) -> Optional[Source]:
+    """ Источник полного списка для фильтра: GET database-сервиса, список или {id: ...} """
+    if not path:
+        return None
+
+    async def load() -> List[str]:
+        resp = await database.get(url=config.database.prefix + path)
+        if resp.status_code != 200:
+            raise RuntimeError(f'{path}: upstream answered {resp.status_code}')
+        data = resp.json()
+        return [str(item) for item in (data.keys() if isinstance(data, dict) else data)]
+
+    return load
+
+
+nicknames_bloom = BloomFilter('nicknames', config.bloom, listing(config.database.nicknames_path))
+users_bloom = BloomFilter('users', config.bloom, listing(config.database.user_ids_path))
+bloom_filters = (nicknames_bloom, users_bloom)
@@ -0,0 +1,25 @@
+from redis.asyncio import ConnectionPool, Redis as aioredis
+from redis.exceptions import RedisError
+
+from src.config import config
+
+# Единый пул соединений Redis для всех роутеров и фоновых задач.
+# Таймауты сокета ограничивают любую операцию: медленный Redis
+# должен приводить к промаху кэша, а не к зависшему запросу.
+pool = ConnectionPool.from_url(
+    config.redis.url,
+    max_connections=config.redis.max_connections,
+    socket_timeout=config.redis.socket_timeout,
+    socket_connect_timeout=config.redis.connect_timeout,
+    health_check_interval=30,
+)
+
+redis = aioredis(connection_pool=pool)
+
+
+async def close_redis() -> None:
+    """ Закрывает соединения общего пула при остановке приложения """
+    await pool.disconnect()
+
+# Ошибки, при которых кэш пропускается, а запрос идёт в апстрим
+CACHE_ERRORS = (OSError, RedisError)
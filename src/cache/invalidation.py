@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from json import loads, dumps
+from typing import Iterable, Optional
+
+from redis.exceptions import WatchError
+
+from .client import redis, CACHE_ERRORS
+from .store import NAMESPACE_TAG, local_cache
+
+logger = logging.getLogger('gateway')
+
+CHANNEL = 'gateway:invalidate'
+
+# Сколько ключей пространства имён удаляется за один проход SCAN
+SCAN_BATCH = 500
+
+# Сколько раз повторить сброс тегов, если их множества изменились между чтением и MULTI
+INVALIDATE_ATTEMPTS = 3
+
+
+async def invalidate(*keys: str, tags: Iterable[str] = ()) -> bool:
+    """
+    Удаляет ключи (и все ключи с указанными тегами) из Redis и из
+    локального кэша всех реплик: остальные процессы узнают об этом
+    через pub/sub. Недоступный Redis не роняет запрос — ключи
+    в нём доживут до своего TTL; в этом случае возвращается False.
+    """
+    tags = list(tags)
+    if not keys and not tags:
+        return True
+
+    sets = [f'tag:{tag}' for tag in tags if not tag.startswith(NAMESPACE_TAG)]
+    try:
+        if not await drop_tagged(list(keys), sets):
+            logger.warning(f'Cache invalidation of {tags} gave up: tag sets kept changing')
+            await forget_local(*keys, tags=tags)
+            return False
+        for tag in tags:
+            if tag.startswith(NAMESPACE_TAG):
+                await drop_namespace(tag.removeprefix(NAMESPACE_TAG))
+    except CACHE_ERRORS as e:
+        logger.warning(f'Cache invalidation of {keys} {tags} failed: {e}')
+        await forget_local(*keys, tags=tags)
+        return False
+
+    await forget_local(*keys, tags=tags)
+    return True
+
+
+async def drop_tagged(keys: list, sets: list) -> bool:
+    """
+    Удаляет ключи, все ключи из множеств тегов и сами множества. Члены
+    читаются SMEMBERS под WATCH, удаление — одним MULTI с UNLINK: все
+    ключи передаются командам явно (в отличие от Lua-скрипта, который
+    трогал бы не объявленные в KEYS ключи). Ключ, привязанный к тегу
+    между чтением и MULTI, сорвёт транзакцию, и она повторится.
+    False — если множества всё время менялись.
+    """
+    if not keys and not sets:
+        return True
+    async with redis.pipeline(transaction=True) as pipe:
+        for _ in range(INVALIDATE_ATTEMPTS):
+            try:
+                members = set()
+                if sets:
+                    await pipe.watch(*sets)
+                    for tag_key in sets:
+                        members.update(await pipe.smembers(tag_key))
+                pipe.multi()
+                pipe.unlink(*keys, *members, *sets)
+                await pipe.execute()
+                return True
+            except WatchError:
+                continue
+    return False
+
+
+async def drop_namespace(namespace: str) -> None:
+    """ Удаляет все ключи пространства имён порциями по SCAN, не блокируя Redis одной командой """
+    batch = []
+    async for key in redis.scan_iter(match=f'{namespace}:*', count=SCAN_BATCH):
+        batch.append(key)
+        if len(batch) >= SCAN_BATCH:
+            await redis.unlink(*batch)
+            batch = []
+    if batch:
+        await redis.unlink(*batch)
+
+
+async def forget_local(*keys: str, tags: Iterable[str] = ()) -> None:
+    """ Сбрасывает ключи только в локальных кэшах (своём и остальных реплик) """
+    keys, tags = list(keys), list(tags)
+    local_cache.invalidate(*keys, tags=tags)
+
+    try:
+        await redis.publish(CHANNEL, dumps({'keys': keys, 'tags': tags}))
+    except CACHE_ERRORS as e:
+        logger.warning(f'Cache invalidation broadcast failed: {e}')
+
+
+class InvalidationListener:
+    """ Фоновая подписка на канал инвалидации локального кэша """
+
+    def __init__(self, channel: str = CHANNEL, retry_delay: float = 1.0, poll_timeout: float = 1.0):
+        self.channel = channel
+        self.retry_delay = retry_delay
+        self.poll_timeout = poll_timeout
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except CACHE_ERRORS as e:
+                logger.warning(f'Cache invalidation channel lost: {e}')
+
+            # Пока подписки не было, сообщения могли потеряться —
+            # локальному кэшу больше нельзя доверять
+            local_cache.clear()
+            await asyncio.sleep(self.retry_delay)
+
+    async def _listen(self) -> None:
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self.channel)
+            local_cache.clear()
+            while True:
+                # Явный таймаут чтения: socket_timeout пула рассчитан
+                # на короткие команды, а не на ожидание сообщений
+                message = await pubsub.get_message(timeout=self.poll_timeout)
+                if message is None or message.get('type') != 'message':
+                    continue
+                try:
+                    payload = loads(message['data'])
+                except ValueError:
+                    logger.warning(f'Malformed invalidation message: {message["data"]!r}')
+                    continue
+                local_cache.invalidate(*payload.get('keys', ()), tags=payload.get('tags', ()))
+        finally:
+            await pubsub.aclose()
+
+
+invalidation_listener = InvalidationListener()
@@ -0,0 +1,126 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Optional, Set
+
+
+def namespace_of(key: str) -> str:
+    """ Пространство имён ключа — всё до первого двоеточия (words, stats, ...) """
+    return key.split(':', 1)[0]
+
+
+@dataclass
+class NamespaceStats:
+    """ Счётчики локального кэша для одного пространства имён """
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+class LocalCache:
+    """
+    Ограниченный по числу записей и объёму LRU/TTL-кэш внутри процесса.
+    Стоит перед Redis и снимает сетевой поход на горячих ключах.
+    """
+
+    def __init__(
+            self,
+            max_entries: int,
+            max_bytes: int,
+            ttls: Dict[str, float],
+            default_ttl: float = 30.0
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.size = 0
+        self._entries: OrderedDict[str, tuple[float, int, Any, tuple]] = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._stats: Dict[str, NamespaceStats] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats_for(self, namespace: str) -> NamespaceStats:
+        stats = self._stats.get(namespace)
+        if stats is None:
+            stats = self._stats[namespace] = NamespaceStats()
+        return stats
+
+    def get(self, key: str) -> Optional[Any]:
+        stats = self.stats_for(namespace_of(key))
+        entry = self._entries.get(key)
+        if entry is None:
+            stats.misses += 1
+            return None
+
+        expires_at, _, value, _ = entry
+        if expires_at <= time.monotonic():
+            self._drop(key)
+            stats.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        stats.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, size: int, tags: Iterable[str] = ()) -> None:
+        ttl = self.ttls.get(namespace_of(key), self.default_ttl)
+        if ttl <= 0 or size > self.max_bytes:
+            return
+
+        self._drop(key)
+        tags = tuple(tags)
+        self._entries[key] = (time.monotonic() + ttl, size, value, tags)
+        self.size += size
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+
+        while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+            evicted = next(iter(self._entries))
+            self._drop(evicted)
+            self.stats_for(namespace_of(evicted)).evictions += 1
+
+    def invalidate(self, *keys: str, tags: Iterable[str] = ()) -> None:
+        keys = set(keys)
+        for tag in tags:
+            keys.update(self._tags.get(tag, ()))
+
+        for key in keys:
+            if self._drop(key):
+                self.stats_for(namespace_of(key)).invalidations += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._tags.clear()
+        self.size = 0
+
+    def _drop(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self.size -= entry[1]
+        for tag in entry[3]:
+            tagged = self._tags.get(tag)
+            if tagged is not None:
+                tagged.discard(key)
+                if not tagged:
+                    del self._tags[tag]
+        return True
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'bytes': self.size,
+            'namespaces': {ns: stats.as_dict() for ns, stats in self._stats.items()},
+        }
@@ -0,0 +1,150 @@
+import logging
+import time
+from json import dumps, loads
+from typing import Any, Dict, Optional
+
+from redis.exceptions import WatchError
+
+from src.config import WriteThroughConfig
+from src.metrics import observe_redis
+from .client import redis, CACHE_ERRORS
+from .invalidation import forget_local
+from .store import pack
+
+logger = logging.getLogger('gateway')
+
+# Сколько раз повторить правку, если записи изменились между чтением и MULTI
+PATCH_ATTEMPTS = 3
+
+
+def item_id(item: Any) -> Optional[str]:
+    if isinstance(item, dict):
+        value = item.get('word_id', item.get('id'))
+        return None if value is None else str(value)
+    return None
+
+
+def encode(data: Any) -> bytes:
+    return dumps(data, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def patch_words(body: bytes, op: str, word_id: str, word: Optional[Dict[str, Any]]):
+    """
+    Новое тело словаря и прежнее состояние слова. Словарь — объект
+    {word_id: слово} или список слов с полем word_id. None вместо тела —
+    запись не разобрать, её надо удалить.
+    """
+    try:
+        data = loads(body)
+    except ValueError:
+        return None, None
+    new = word if op == 'save' else None
+    if isinstance(data, dict):
+        old = data.pop(word_id, None)
+        if new is not None:
+            data[word_id] = new
+    elif isinstance(data, list):
+        old = next((item for item in data if item_id(item) == word_id), None)
+        data = [item for item in data if item_id(item) != word_id]
+        if new is not None:
+            data.append(new)
+    else:
+        return None, None
+    return encode(data), old
+
+
+def patch_stats(
+        body: bytes,
+        old: Any,
+        new: Any,
+        settings: WriteThroughConfig
+) -> Optional[bytes]:
+    """ Счётчики статистики после замены old на new; None — их не поправить """
+    try:
+        stats = loads(body)
+    except ValueError:
+        return None
+    fields = [field for field in (settings.stats_total_field, settings.stats_public_field) if field]
+    if not isinstance(stats, dict) or not all(
+            type(stats.get(field)) is int for field in fields
+    ):
+        return None
+
+    def public(item):
+        return int(isinstance(item, dict) and item.get('is_public') is True)
+
+    stats[settings.stats_total_field] += (new is not None) - (old is not None)
+    if settings.stats_public_field:
+        stats[settings.stats_public_field] += public(new) - public(old)
+    return encode(stats)
+
+
+async def patch_word(
+        user_id: int,
+        op: str,
+        word_id: int,
+        settings: WriteThroughConfig,
+        word: Optional[Dict[str, Any]] = None
+) -> bool:
+    """
+    Write-through для словаря: после подтверждённой апстримом записи
+    добавляет (op='save') или удаляет (op='delete') слово прямо
+    в закэшированном `words:{user_id}` и в той же транзакции поправляет
+    счётчики `stats:{user_id}`. Прочие ключи тега `dictionary:{user_id}`
+    (поиск) сбрасываются. Тела правятся через json, а не cjson в Lua:
+    пустые списки и большие числа в остальных словах не искажаются.
+    Сжатые и неразборчивые записи удаляются; счётчики правятся, только
+    если прежнее состояние слова известно из словаря. Срок жизни записей
+    не меняется. False — если Redis недоступен или записи всё время
+    меняются параллельно, и нужна обычная инвалидация.
+    """
+    tag = f'dictionary:{user_id}'
+    words_key, stats_key, tag_key = f'words:{user_id}', f'stats:{user_id}', f'tag:{tag}'
+    started = time.perf_counter()
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            for _ in range(PATCH_ATTEMPTS):
+                try:
+                    await pipe.watch(words_key, stats_key)
+                    words_body, words_enc = await pipe.hmget(words_key, 'body', 'enc')
+                    stats_body, stats_enc = await pipe.hmget(stats_key, 'body', 'enc')
+                    tagged = await pipe.smembers(tag_key)
+
+                    pipe.multi()
+                    patched, known, old = None, False, None
+                    if words_body is not None:
+                        if not words_enc:
+                            patched, old = patch_words(words_body, op, str(word_id), word)
+                        if patched is None:
+                            pipe.delete(words_key)
+                        else:
+                            known = True
+                            pipe.hset(words_key, mapping=pack(patched))
+                    if stats_body is not None:
+                        stats = None
+                        if known and not stats_enc:
+                            new = word if op == 'save' else None
+                            stats = patch_stats(stats_body, old, new, settings)
+                        if stats is None:
+                            pipe.delete(stats_key)
+                        else:
+                            pipe.hset(stats_key, mapping=pack(stats))
+                    others = [key for key in tagged if key not in (words_key.encode(), stats_key.encode())]
+                    if others:
+                        pipe.delete(*others)
+                        pipe.srem(tag_key, *others)
+                    await pipe.execute()
+                    break
+                except WatchError:
+                    continue
+            else:
+                logger.warning(f'Cache patch of {words_key} gave up: entries kept changing')
+                return False
+        observe_redis('patch', started)
+    except CACHE_ERRORS as e:
+        logger.warning(f'Cache patch of {words_key} failed: {e}')
+        return False
+
+    # Реплики перечитают исправленные записи из Redis, а не из апстрима
+    await forget_local(tags=[tag])
+    return True
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+from uuid import uuid4
+
+from redis.asyncio import Redis
+
+from .client import CACHE_ERRORS
+
+logger = logging.getLogger('gateway')
+
+T = TypeVar('T')
+
+# Снимаем блокировку, только если она всё ещё наша
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# Продлевает блокировку, только если она всё ещё наша
+EXTEND_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Awaitable, который завершится, когда результат целиком окажется в кэше
+# (потоковое тело), или None, если результат готов сразу
+Until = Callable[[Any], Optional[Awaitable[Any]]]
+
+
+class SingleFlight:
+    """
+    Склеивает параллельные промахи кэша по одному ключу.
+
+    Внутри процесса одновременно выполняется не больше одного запроса
+    к апстриму на ключ, остальные корутины ждут его результат. Между
+    репликами ту же роль играет короткая блокировка в Redis: пока она
+    занята, остальные реплики опрашивают кэш через `recheck`.
+
+    Если результат ещё дописывается в кэш после возврата (`until`
+    отдаёт awaitable его завершения), ключ и блокировка удерживаются
+    до этого момента, но не дольше `hold_ttl`.
+    """
+
+    def __init__(
+            self,
+            redis: Optional[Redis] = None,
+            lock_ttl: float = 5.0,
+            poll_interval: float = 0.05,
+            hold_ttl: float = 60.0
+    ):
+        self.redis = redis
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.hold_ttl = hold_ttl
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._held: Dict[str, asyncio.Task] = {}
+        self._refreshing: set[str] = set()
+
+    async def do(
+            self,
+            key: str,
+            fetch: Callable[[], Awaitable[T]],
+            recheck: Optional[Callable[[], Awaitable[Optional[T]]]] = None,
+            until: Optional[Until] = None
+    ) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.create_task(self._run(key, fetch, recheck, until))
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        # Отмена одного из ожидающих не должна отменять общий запрос
+        return await asyncio.shield(task)
+
+    async def refresh(self, key: str, fetch: Callable[[], Awaitable[T]]) -> None:
+        """
+        Фоновое обновление ключа. Выполняется, только если ключ сейчас
+        не обновляет ни этот процесс, ни другая реплика; ошибки апстрима
+        лишь логируются — до hard TTL продолжает отдаваться старое значение.
+        """
+        if key in self._refreshing or key in self._calls:
+            return
+
+        self._refreshing.add(key)
+        try:
+            if self.redis is not None:
+                # Блокировку не снимаем: до истечения она же ограничивает
+                # частоту фоновых обновлений ключа между репликами
+                acquired = await self.redis.set(
+                    f'refresh:{key}', 1, nx=True, px=int(self.lock_ttl * 1000)
+                )
+                if not acquired:
+                    return
+            await fetch()
+        except Exception as e:
+            logger.warning(f'Background refresh of {key} failed: {e}')
+        finally:
+            self._refreshing.discard(key)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task and key not in self._held:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # помечаем исключение как полученное
+
+    async def _hold(self, key, value, until, lock=None):
+        """ Возвращает результат; если он ещё дописывается в кэш, ключ остаётся занятым до конца """
+        pending = until(value) if until is not None else None
+        if pending is None:
+            if lock is not None:
+                await self._release(*lock)
+            return value
+        self._held[key] = asyncio.create_task(
+            self._settle(key, asyncio.current_task(), pending, lock)
+        )
+        return value
+
+    async def _settle(self, key, task, pending, lock):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.hold_ttl
+        waiter = asyncio.ensure_future(pending)
+        try:
+            while not waiter.done() and loop.time() < deadline:
+                timeout = min(self.lock_ttl / 2, deadline - loop.time())
+                await asyncio.wait([waiter], timeout=timeout)
+                if lock is not None and not waiter.done():
+                    await self.redis.eval(
+                        EXTEND_SCRIPT, 1, *lock, int(self.lock_ttl * 1000)
+                    )
+        except CACHE_ERRORS as e:
+            logger.warning(f'Single-flight hold of {key} stopped: {e}')
+        finally:
+            waiter.cancel()
+            self._held.pop(key, None)
+            if self._calls.get(key) is task:
+                del self._calls[key]
+            if lock is not None:
+                await self._release(*lock)
+
+    async def _release(self, lock_key: str, token: str) -> None:
+        try:
+            await self.redis.eval(RELEASE_SCRIPT, 1, lock_key, token)
+        except CACHE_ERRORS as e:
+            logger.warning(f'Failed to release lock {lock_key}: {e}')
+
+    async def _run(self, key, fetch, recheck, until):
+        if self.redis is None or recheck is None:
+            return await self._hold(key, await fetch(), until)
+
+        lock_key = f'lock:{key}'
+        token = uuid4().hex
+        try:
+            acquired = await self.redis.set(
+                lock_key, token, nx=True, px=int(self.lock_ttl * 1000)
+            )
+        except CACHE_ERRORS as e:
+            logger.warning(f'Single-flight lock for {key} is unavailable: {e}')
+            return await self._hold(key, await fetch(), until)
+
+        if acquired:
+            try:
+                value = await fetch()
+            except BaseException:
+                await self._release(lock_key, token)
+                raise
+            return await self._hold(key, value, until, (lock_key, token))
+
+        # Ключ уже запрашивает другая реплика — ждём, пока она заполнит кэш
+        # (пока тело дописывается потоком, она продлевает блокировку)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max(self.lock_ttl, self.hold_ttl)
+        try:
+            while loop.time() < deadline:
+                await asyncio.sleep(self.poll_interval)
+                cached = await recheck()
+                if cached is not None:
+                    return cached
+                if not await self.redis.exists(lock_key):
+                    break
+        except CACHE_ERRORS as e:
+            logger.warning(f'Single-flight wait for {key} failed: {e}')
+
+        return await self._hold(key, await fetch(), until)
@@ -0,0 +1,477 @@
+import asyncio
+import hashlib
+import logging
+import time
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from src.config import config, CachePolicy
+from src.metrics import cache_requests, note_cache, observe_redis
+from src.upstream import is_unavailable
+from .client import redis, CACHE_ERRORS
+from .local import LocalCache, namespace_of
+from .singleflight import SingleFlight
+
+logger = logging.getLogger('gateway')
+
+local_cache = LocalCache(
+    max_entries=config.local_cache.max_entries,
+    max_bytes=config.local_cache.max_bytes,
+    ttls=config.local_cache.ttls,
+)
+
+flight = SingleFlight(
+    redis,
+    lock_ttl=config.flight_lock_ttl.total_seconds(),
+    hold_ttl=config.flight_hold_ttl.total_seconds(),
+)
+
+# Условное чтение: при совпадении ETag с одним из ARGV — {etag, pttl}
+# без тела, иначе ещё и {body, enc}, чтобы ответить телом без второго
+# обращения к Redis
+CONDITIONAL_GET_SCRIPT = redis.register_script("""
+local etag = redis.call('hget', KEYS[1], 'etag')
+if etag then
+    for i = 1, #ARGV do
+        if ARGV[i] == '*' or ARGV[i] == etag then
+            return {etag, redis.call('pttl', KEYS[1])}
+        end
+    end
+end
+local entry = redis.call('hmget', KEYS[1], 'body', 'enc')
+return {etag, redis.call('pttl', KEYS[1]), entry[1], entry[2]}
+""")
+
+
+@dataclass
+class Cached:
+    """
+    Закэшированное тело ответа. После `fresh_until` (soft TTL) оно устарело,
+    после `expires_at` (hard TTL) его можно отдать, только если апстрим
+    недоступен (запасное окно fallback_ttl). `etag` — хеш тела для
+    условных запросов (у записей, положенных до его появления, — None).
+    """
+    value: bytes
+    fresh_until: float = float('inf')
+    expires_at: float = float('inf')
+    etag: Optional[str] = None
+
+    @property
+    def stale(self) -> bool:
+        return time.time() >= self.fresh_until
+
+    @property
+    def expired(self) -> bool:
+        return time.time() >= self.expires_at
+
+    @classmethod
+    def from_pttl(
+            cls,
+            value: bytes,
+            policy: Optional[CachePolicy],
+            pttl: int,
+            etag: Optional[str] = None
+    ) -> 'Cached':
+        """ Восстанавливает сроки по оставшемуся в Redis времени жизни (hard TTL + запасное окно) """
+        if policy is None or pttl < 0:
+            return cls(value, etag=etag)
+        expires_at = time.time() + pttl / 1000 - policy.fallback_ttl.total_seconds()
+        stale_window = (policy.hard_ttl - policy.soft_ttl).total_seconds()
+        return cls(value, expires_at - stale_window, expires_at, etag)
+
+    @classmethod
+    def fresh(cls, value: bytes, policy: Optional[CachePolicy], etag: Optional[str] = None) -> 'Cached':
+        if policy is None:
+            return cls(value, etag=etag)
+        now = time.time()
+        return cls(
+            value,
+            now + policy.soft_ttl.total_seconds(),
+            now + policy.hard_ttl.total_seconds(),
+            etag,
+        )
+
+
+@dataclass
+class EtagCheck:
+    """
+    Итог cached_etag. `etag` — живая запись совпала с If-None-Match
+    (обращение уже учтено в метриках); иначе, если `read`, в `entry` —
+    то, что вернул бы get_blob, и read_through_etag берёт её вместо
+    повторного чтения.
+    """
+    etag: Optional[str] = None
+    entry: Optional[Cached] = None
+    read: bool = False
+
+
+def count_lookup(key: str, result: str) -> None:
+    namespace = namespace_of(key)
+    cache_requests.inc(namespace, result)
+    note_cache(namespace, result)
+
+
+NAMESPACE_TAG = 'ns:'
+
+
+def key_tags(key: str, tags: Iterable[str] = ()) -> tuple:
+    """
+    Теги ключа в локальном кэше: переданные явно (например, user:{id}) плюс
+    его пространство имён. В Redis тег пространства имён не хранится —
+    множество всех когда-либо закэшированных ключей росло бы без предела;
+    invalidate находит такие ключи по шаблону (SCAN).
+    """
+    return (*tags, f'{NAMESPACE_TAG}{namespace_of(key)}')
+
+
+EMPTY_BODIES = (b'', b'{}', b'[]', b'null')
+
+
+def is_empty(body: bytes) -> bool:
+    """ Пустой JSON-ответ апстрима (он кэшируется только коротко) — без разбора тела """
+    return body.strip() in EMPTY_BODIES
+
+
+def negative(policy: CachePolicy) -> CachePolicy:
+    """
+    Политика для пустого ответа: свежим он считается только negative_ttl.
+    Окно устаревания и запасное окно те же, что у исходной политики, поэтому
+    запись, прочитанная с исходной политикой (Cached.from_pttl), получает
+    те же границы.
+    """
+    ttl = min(config.negative_ttl, policy.soft_ttl)
+    return CachePolicy(
+        ttl, ttl + (policy.hard_ttl - policy.soft_ttl), swr=policy.swr,
+        fallback_ttl=policy.fallback_ttl,
+    )
+
+
+def make_etag(body: bytes) -> str:
+    """ Хеш несжатого тела (потоковое заполнение считает тот же по кускам) """
+    return hashlib.sha1(body).hexdigest()[:16]
+
+
+def etag_candidates(if_none_match: str) -> list:
+    """ ETag-и из If-None-Match без кавычек и признака W/ (слабое сравнение) """
+    return [candidate.strip().removeprefix('W/').strip('"') for candidate in if_none_match.split(',')]
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """ Совпадает ли ETag с одним из перечисленных в If-None-Match """
+    return any(candidate in ('*', etag) for candidate in etag_candidates(if_none_match))
+
+
+def pack(body: bytes) -> Dict[str, bytes]:
+    """ Поля Redis-хэша записи: тело ответа (сжатое, если оно достаточно велико) и его ETag """
+    etag = make_etag(body).encode()
+    if len(body) >= config.redis.compress_min_bytes:
+        return {'body': zlib.compress(body, config.redis.compress_level), 'enc': b'zlib', 'etag': etag}
+    return {'body': body, 'enc': b'', 'etag': etag}
+
+
+def unpack(body: Optional[bytes], enc: Optional[bytes]) -> Optional[bytes]:
+    if body is None:
+        return None
+    if enc == b'zlib':
+        return zlib.decompress(body)
+    return body
+
+
+async def get_blob(
+        key: str,
+        policy: Optional[CachePolicy] = None,
+        tags: Iterable[str] = ()
+) -> Optional[Cached]:
+    """
+    Читает закэшированное тело ответа: сначала из памяти процесса, затем
+    из Redis. Тело хранится уже сериализованным и не разбирается.
+    Может вернуть запись с истёкшим hard TTL (`expired`) — она годится
+    только как запасная. Недоступный Redis считается промахом.
+    """
+    entry = local_cache.get(key)
+    if entry is not None and not entry.expired:
+        return entry
+
+    started = time.perf_counter()
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.hmget(key, 'body', 'enc', 'etag')
+            pipe.pttl(key)
+            (body, enc, etag), pttl = await pipe.execute()
+        observe_redis('get', started)
+    except CACHE_ERRORS as e:
+        logger.warning(f'Cache read of {key} skipped: {e}')
+        return entry
+
+    return _load_entry(key, body, enc, etag, pttl, policy, tags)
+
+
+async def get_many(
+        keys: Dict[Any, str],
+        policy: Optional[CachePolicy] = None,
+        tags: Optional[Callable[[Any], Iterable[str]]] = None
+) -> Dict[Any, Cached]:
+    """
+    Пакетное чтение: `keys` сопоставляет идентификатор (обычно user_id)
+    с ключом кэша. Всё, чего нет в памяти процесса, читается из Redis
+    за один конвейерный проход. Отсутствующие записи в ответ не попадают,
+    истёкшие (запасные) — попадают, как и в get_blob.
+    """
+    found: Dict[Any, Cached] = {}
+    remote = []
+    for ident, key in keys.items():
+        entry = local_cache.get(key)
+        if entry is not None:
+            found[ident] = entry
+        if entry is None or entry.expired:
+            remote.append((ident, key))
+
+    if not remote:
+        return found
+
+    started = time.perf_counter()
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            for _, key in remote:
+                pipe.hmget(key, 'body', 'enc', 'etag')
+                pipe.pttl(key)
+            replies = await pipe.execute()
+        observe_redis('get_many', started)
+    except CACHE_ERRORS as e:
+        logger.warning(f'Batch cache read of {len(remote)} keys skipped: {e}')
+        return found
+
+    for i, (ident, key) in enumerate(remote):
+        (body, enc, etag), pttl = replies[2 * i], replies[2 * i + 1]
+        entry = _load_entry(key, body, enc, etag, pttl, policy, tags(ident) if tags else ())
+        if entry is not None:
+            found[ident] = entry
+    return found
+
+
+def _load_entry(key, body, enc, etag, pttl, policy, tags) -> Optional[Cached]:
+    """ Распаковывает прочитанную из Redis запись и кладёт её в локальный кэш """
+    try:
+        body = unpack(body, enc)
+    except zlib.error as e:
+        logger.warning(f'Corrupted cache entry {key}: {e}')
+        return None
+    if body is None:
+        return None
+
+    entry = Cached.from_pttl(body, policy, pttl, etag.decode() if etag else None)
+    local_cache.set(key, entry, size=len(body), tags=key_tags(key, tags))
+    return entry
+
+
+def queue_tags(pipe, key: str, tags: Iterable[str], policy: Optional[CachePolicy]) -> None:
+    """ Добавляет в конвейер привязку ключа к множествам его тегов """
+    for tag in tags:
+        tag_key = f'tag:{tag}'
+        pipe.sadd(tag_key, key)
+        if policy is not None:
+            # Множество тега живёт не меньше самого долгого из своих ключей
+            pipe.expire(tag_key, policy.storage_ttl, nx=True)
+            pipe.expire(tag_key, policy.storage_ttl, gt=True)
+
+
+async def set_blob(
+        key: str,
+        body: bytes,
+        policy: Optional[CachePolicy],
+        tags: Iterable[str] = ()
+) -> None:
+    """
+    Кладёт готовое тело ответа в Redis и в локальный кэш.
+    Запись, срок жизни и привязка к тегам уходят одной транзакцией.
+    """
+    tags = tuple(tags)
+    fields = pack(body)
+    started = time.perf_counter()
+    try:
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping=fields)
+            if policy is not None:
+                pipe.expire(key, policy.storage_ttl)
+            queue_tags(pipe, key, tags, policy)
+            await pipe.execute()
+        observe_redis('set', started)
+    except CACHE_ERRORS as e:
+        logger.warning(f'Cache write of {key} skipped: {e}')
+        return
+
+    local_cache.set(
+        key, Cached.fresh(body, policy, fields['etag'].decode()), size=len(body),
+        tags=key_tags(key, tags)
+    )
+
+
+class Deferred(ABC):
+    """
+    Тело ответа, которое ещё не прочитано из апстрима (см. stream.Passthrough).
+    Его может забрать только один клиент; кэш заполняется попутно, и
+    остальные ожидающие ждут `finished`, а потом читают тело из кэша.
+    """
+
+    _claimed: bool = False
+
+    def __init__(self):
+        self._finished = asyncio.Event()
+
+    def finish(self) -> None:
+        """ Тело дочитано, запись в кэш (если она была) завершена """
+        self._finished.set()
+
+    def finished(self) -> Awaitable[Any]:
+        return self._finished.wait()
+
+    def claim(self) -> bool:
+        if self._claimed:
+            return False
+        self._claimed = True
+        return True
+
+    @abstractmethod
+    async def drain(self) -> None:
+        """ Дочитывает тело без клиента — только ради заполнения кэша """
+
+
+_refreshes: set[asyncio.Task] = set()
+
+
+def revalidate(key: str, fetch: Callable[[], Awaitable[Any]]) -> None:
+    """ Запускает фоновое обновление устаревшей записи """
+
+    async def refetch():
+        body = await fetch()
+        if isinstance(body, Deferred) and body.claim():
+            await body.drain()
+
+    task = asyncio.create_task(flight.refresh(key, refetch))
+    _refreshes.add(task)
+    task.add_done_callback(_refreshes.discard)
+
+
+async def drain_refreshes(timeout: float) -> None:
+    """ Даёт фоновым обновлениям завершиться при остановке, остальные отменяет """
+    if not _refreshes:
+        return
+    _, pending = await asyncio.wait(set(_refreshes), timeout=timeout)
+    for task in pending:
+        task.cancel()
+
+
+async def read_through(
+        key: str,
+        fetch: Callable[[], Awaitable[bytes | Deferred]],
+        policy: CachePolicy,
+        tags: Iterable[str] = ()
+) -> bytes | Deferred:
+    """
+    Отдаёт тело ответа из кэша, а при промахе — результат `fetch`
+    (который сам кладёт ответ в кэш). Устаревшую в режиме
+    stale-while-revalidate запись отдаёт сразу и обновляет в фоне.
+    Если апстрим недоступен, отдаёт последнюю запись из запасного окна.
+    """
+    body, _ = await read_through_etag(key, fetch, policy, tags)
+    return body
+
+
+async def read_through_etag(
+        key: str,
+        fetch: Callable[[], Awaitable[bytes | Deferred]],
+        policy: CachePolicy,
+        tags: Iterable[str] = (),
+        checked: Optional[EtagCheck] = None
+) -> Tuple[bytes | Deferred, Optional[str]]:
+    """
+    Как read_through, но вместе с ETag тела (у потокового ответа его нет).
+    `checked` — итог cached_etag: прочитанная им запись не читается снова,
+    а совпавшая уже учтена в метриках.
+    """
+    entry = checked.entry if checked is not None and checked.read else await get_blob(key, policy, tags)
+    if entry is not None and not entry.expired:
+        # Совпавшую с If-None-Match запись cached_etag уже учёл
+        if checked is None or not checked.etag:
+            if entry.stale:
+                count_lookup(key, 'stale')
+                revalidate(key, fetch)
+            else:
+                count_lookup(key, 'hit')
+        return entry.value, entry.etag or make_etag(entry.value)
+    count_lookup(key, 'miss')
+
+    async def recheck():
+        cached = await get_blob(key, policy, tags)
+        return cached.value if cached and not cached.expired else None
+
+    def until(value):
+        return value.finished() if isinstance(value, Deferred) else None
+
+    try:
+        body = await flight.do(key, fetch, recheck=recheck, until=until)
+    except Exception as e:
+        if entry is None or not is_unavailable(e):
+            raise
+        logger.warning(f'Upstream unavailable for {key}, serving last cached value: {e}')
+        count_lookup(key, 'fallback')
+        return entry.value, entry.etag or make_etag(entry.value)
+    if isinstance(body, Deferred) and not body.claim():
+        # Потоковое тело уже отдаётся другому клиенту и попутно пишется
+        # в кэш — дожидаемся записи, а не идём в апстрим сами
+        try:
+            await asyncio.wait_for(body.finished(), flight.hold_ttl)
+        except asyncio.TimeoutError:
+            pass
+        cached = await get_blob(key, policy, tags)
+        if cached is not None and not cached.expired:
+            return cached.value, cached.etag or make_etag(cached.value)
+        # В кэш тело не попало (слишком большое, Redis недоступен) — запрашиваем своё
+        body = await fetch()
+        if isinstance(body, Deferred):
+            body.claim()
+    return body, None if isinstance(body, Deferred) else make_etag(body)
+
+
+async def cached_etag(
+        key: str,
+        fetch: Callable[[], Awaitable[bytes | Deferred]],
+        policy: CachePolicy,
+        if_none_match: str,
+        tags: Iterable[str] = ()
+) -> EtagCheck:
+    """
+    Проверяет If-None-Match по закэшированной записи за одно обращение:
+    из локального кэша или скриптом, который читает тело, только если
+    ETag не совпал. Устаревшая совпавшая запись, как и в read_through,
+    годится и обновляется в фоне.
+    """
+    entry = local_cache.get(key)
+    if entry is None or entry.expired:
+        started = time.perf_counter()
+        try:
+            etag, pttl, *rest = await CONDITIONAL_GET_SCRIPT(
+                keys=[key], args=etag_candidates(if_none_match)
+            )
+            observe_redis('etag', started)
+        except CACHE_ERRORS as e:
+            logger.warning(f'Cache ETag read of {key} skipped: {e}')
+            return EtagCheck(entry=entry, read=True)
+        if rest:
+            return EtagCheck(entry=_load_entry(key, *rest, etag, pttl, policy, tags), read=True)
+        entry = Cached.from_pttl(b'', policy, pttl, etag.decode())
+        if entry.expired:
+            # Годится только как запасная — за телом сходит read_through_etag
+            return EtagCheck()
+    elif not (entry.etag and etag_matches(if_none_match, entry.etag)):
+        return EtagCheck(entry=entry, read=True)
+
+    if entry.stale:
+        count_lookup(key, 'stale')
+        revalidate(key, fetch)
+    else:
+        count_lookup(key, 'hit')
+    return EtagCheck(etag=entry.etag)
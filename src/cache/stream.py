@@ -0,0 +1,162 @@
+import hashlib
+import logging
+import time
+import zlib
+from typing import AsyncIterator, Iterable, Optional, Union
+from uuid import uuid4
+
+import httpx
+
+from src.config import config, CachePolicy
+from src.metrics import observe_redis
+from .client import redis, CACHE_ERRORS
+from .store import Deferred, is_empty, negative, queue_tags, set_blob
+
+logger = logging.getLogger('gateway')
+
+# Переносит накопленное во временном ключе тело в запись кэша,
+# не вытаскивая его обратно в память шлюза
+FINALIZE_SCRIPT = redis.register_script("""
+local body = redis.call('get', KEYS[1])
+if not body then
+    return 0
+end
+redis.call('del', KEYS[2])
+redis.call('hset', KEYS[2], 'body', body, 'enc', ARGV[1], 'etag', ARGV[3])
+if tonumber(ARGV[2]) > 0 then
+    redis.call('pexpire', KEYS[2], ARGV[2])
+end
+redis.call('del', KEYS[1])
+return 1
+""")
+
+# Сколько живёт временный ключ недописанного тела
+FILL_TTL_MS = 60_000
+
+
+class Passthrough(Deferred):
+    """
+    Потоковый ответ апстрима: байты уходят клиенту по мере поступления,
+    а кэш заполняется попутно — кусками через APPEND во временный ключ
+    Redis, который в конце атомарно становится записью кэша. Полной
+    копии тела в памяти шлюза не появляется; слишком большие ответы
+    в кэш не попадают.
+    """
+
+    def __init__(
+            self,
+            response: httpx.Response,
+            key: str,
+            policy: CachePolicy,
+            tags: Iterable[str] = ()
+    ):
+        super().__init__()
+        self.response = response
+        self.key = key
+        self.policy = policy
+        self.tags = tuple(tags)
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        fill_key = f'{self.key}:fill:{uuid4().hex}'
+        length = self.response.headers.get('content-length')
+        caching = length is None or int(length) <= config.proxy.cache_max_bytes
+        compress = length is None or int(length) >= config.redis.compress_min_bytes
+        compressor = zlib.compressobj(config.redis.compress_level) if compress else None
+        # ETag считается по несжатым байтам, как и в make_etag
+        digest = hashlib.sha1()
+        size = 0
+        complete = False
+
+        try:
+            async for chunk in self.response.aiter_bytes():
+                yield chunk
+
+                if not caching:
+                    continue
+                size += len(chunk)
+                if size > config.proxy.cache_max_bytes:
+                    caching = False
+                    await self._discard(fill_key)
+                    continue
+                digest.update(chunk)
+                piece = compressor.compress(chunk) if compressor else chunk
+                if piece:
+                    caching = await self._append(fill_key, piece)
+
+            complete = True
+        finally:
+            try:
+                await self.response.aclose()
+                if caching and complete:
+                    tail = compressor.flush() if compressor else b''
+                    etag = digest.hexdigest()[:16]
+                    await self._finalize(fill_key, tail, b'zlib' if compressor else b'', etag)
+                elif caching:
+                    await self._discard(fill_key)
+            finally:
+                self.finish()
+
+    async def drain(self) -> None:
+        async for _ in self:
+            pass
+
+    async def _append(self, fill_key: str, piece: bytes) -> bool:
+        started = time.perf_counter()
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.append(fill_key, piece)
+                pipe.pexpire(fill_key, FILL_TTL_MS)
+                await pipe.execute()
+            observe_redis('append', started)
+            return True
+        except CACHE_ERRORS as e:
+            logger.warning(f'Streaming cache fill of {self.key} stopped: {e}')
+            await self._discard(fill_key)
+            return False
+
+    async def _finalize(self, fill_key: str, tail: bytes, enc: bytes, etag: str) -> None:
+        ttl_ms = int(self.policy.storage_ttl.total_seconds() * 1000)
+        started = time.perf_counter()
+        try:
+            async with redis.pipeline(transaction=True) as pipe:
+                if tail:
+                    pipe.append(fill_key, tail)
+                await FINALIZE_SCRIPT(
+                    keys=[fill_key, self.key], args=[enc, ttl_ms, etag], client=pipe
+                )
+                queue_tags(pipe, self.key, self.tags, self.policy)
+                await pipe.execute()
+            observe_redis('finalize', started)
+        except CACHE_ERRORS as e:
+            logger.warning(f'Streaming cache fill of {self.key} failed: {e}')
+            await self._discard(fill_key)
+
+    @staticmethod
+    async def _discard(fill_key: str) -> None:
+        try:
+            await redis.delete(fill_key)
+        except CACHE_ERRORS:
+            pass
+
+
+async def relay(
+        response: httpx.Response,
+        key: str,
+        policy: CachePolicy,
+        tags: Iterable[str] = ()
+) -> Union[bytes, Passthrough]:
+    """
+    Решает по Content-Length, читать ли ответ апстрима целиком
+    (небольшие тела — как раньше, через set_blob) или отдавать его потоком.
+    Ответ должен быть открыт с stream=True.
+    """
+    length: Optional[str] = response.headers.get('content-length')
+    if length is not None and int(length) < config.proxy.stream_min_bytes:
+        try:
+            body = await response.aread()
+        finally:
+            await response.aclose()
+        await set_blob(key, body, negative(policy) if is_empty(body) else policy, tags)
+        return body
+
+    return Passthrough(response, key, policy, tags)
@@ -1,47 +1,456 @@
 import os
 from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
+from typing import List, Optional
+
+
+def env_flag(name: str, default: bool = False) -> bool:
+    """ Читает булев флаг из переменной окружения """
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class ConfigError(RuntimeError):
+    """ Окружение не задаёт обязательные настройки или задаёт их неверно """
+
+
+# Ошибки обязательных переменных копятся при импорте и поднимаются Config.validate()
+_env_errors: List[str] = []
+
+
+def required_env(name: str) -> Optional[str]:
+    """ Обязательная переменная окружения (её наличие проверяет Config.validate) """
+    value = os.getenv(name)
+    if not value:
+        _env_errors.append(f'{name} is not set')
+    return value
+
+
+def required_int(name: str) -> Optional[int]:
+    value = required_env(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        _env_errors.append(f'{name} must be an integer, got {value!r}')
+        return None
 
 
+@dataclass
+class HttpClientConfig:
+    """ Настройки пула HTTP-соединений к апстрим-сервису """
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    timeout: float = 5.0
+    connect_timeout: float = 2.0
+    http2: bool = False
+
+    @classmethod
+    def from_env(cls, prefix: str, timeout: float = 5.0) -> 'HttpClientConfig':
+        return cls(
+            max_connections=int(os.getenv(f'{prefix}_POOL_SIZE', 100)),
+            max_keepalive_connections=int(os.getenv(f'{prefix}_POOL_KEEPALIVE', 20)),
+            keepalive_expiry=float(os.getenv(f'{prefix}_KEEPALIVE_EXPIRY', 30.0)),
+            timeout=float(os.getenv(f'{prefix}_TIMEOUT', timeout)),
+            connect_timeout=float(os.getenv(f'{prefix}_CONNECT_TIMEOUT', 2.0)),
+            http2=env_flag(f'{prefix}_HTTP2'),
+        )
+
+@dataclass
+class BreakerConfig:
+    """ Порог размыкания цепи апстрима по доле ошибок и медленных вызовов """
+    enabled: bool = True
+    window_seconds: float = 30.0
+    min_calls: int = 20
+    failure_rate: float = 0.5
+    slow_call_seconds: float = 3.0
+    open_seconds: float = 15.0
+    half_open_calls: int = 3
+
+    @classmethod
+    def from_env(cls, prefix: str, slow_call_seconds: float = 3.0) -> 'BreakerConfig':
+        return cls(
+            enabled=env_flag(f'{prefix}_BREAKER', True),
+            window_seconds=float(os.getenv(f'{prefix}_BREAKER_WINDOW', 30.0)),
+            min_calls=int(os.getenv(f'{prefix}_BREAKER_MIN_CALLS', 20)),
+            failure_rate=float(os.getenv(f'{prefix}_BREAKER_FAILURE_RATE', 0.5)),
+            slow_call_seconds=float(os.getenv(f'{prefix}_BREAKER_SLOW_CALL', slow_call_seconds)),
+            open_seconds=float(os.getenv(f'{prefix}_BREAKER_OPEN', 15.0)),
+            half_open_calls=int(os.getenv(f'{prefix}_BREAKER_HALF_OPEN_CALLS', 3)),
+        )
+
+@dataclass
+class HedgingConfig:
+    """
+    Хеджирование и повторы идемпотентных GET-запросов к апстриму (по умолчанию
+    выключены). Доля дополнительных попыток ограничена budget_ratio.
+    """
+    enabled: bool = False
+    percentile: float = 95.0
+    min_delay: float = 0.02
+    max_delay: float = 1.0
+    max_retries: int = 1
+    backoff_base: float = 0.05
+    backoff_cap: float = 0.5
+    budget_ratio: float = 0.1
+    budget_burst: float = 10.0
+
+    @classmethod
+    def from_env(cls, prefix: str) -> 'HedgingConfig':
+        return cls(
+            enabled=env_flag(f'{prefix}_HEDGING'),
+            percentile=float(os.getenv(f'{prefix}_HEDGE_PERCENTILE', 95.0)),
+            min_delay=float(os.getenv(f'{prefix}_HEDGE_MIN_DELAY', 0.02)),
+            max_delay=float(os.getenv(f'{prefix}_HEDGE_MAX_DELAY', 1.0)),
+            max_retries=int(os.getenv(f'{prefix}_RETRIES', 1)),
+            backoff_base=float(os.getenv(f'{prefix}_RETRY_BACKOFF', 0.05)),
+            backoff_cap=float(os.getenv(f'{prefix}_RETRY_BACKOFF_CAP', 0.5)),
+            budget_ratio=float(os.getenv(f'{prefix}_RETRY_BUDGET', 0.1)),
+            budget_burst=float(os.getenv(f'{prefix}_RETRY_BUDGET_BURST', 10.0)),
+        )
+
 @dataclass
 class PayHandlerConfig:
-    prefix: str = os.getenv('PAYMENT_HANDLER_PREFIX')
+    prefix: str = required_env('PAYMENT_HANDLER_PREFIX')
 
 @dataclass
 class PayWebhookConfig:
+    """ Вебхук платёжного сервиса об изменении статуса платежа (src/endpoints/webhooks.py) """
     prefix: str = os.getenv('PAYMENT_WEBHOOK_PREFIX')
+    # Общий секрет HMAC-SHA256; без него вебхук отклоняет все вызовы
+    secret: str = os.getenv('PAYMENT_WEBHOOK_SECRET')
+    signature_header: str = os.getenv('PAYMENT_WEBHOOK_SIGNATURE_HEADER', 'X-Webhook-Signature')
+    timestamp_header: str = os.getenv('PAYMENT_WEBHOOK_TIMESTAMP_HEADER', 'X-Webhook-Timestamp')
+    # Насколько отметка времени подписи может расходиться с часами шлюза (секунды)
+    tolerance: int = int(os.getenv('PAYMENT_WEBHOOK_TOLERANCE', 300))
+    # Сколько помнить обработанные event_id (повторы отвечаются без действий)
+    replay_ttl: int = int(os.getenv('PAYMENT_WEBHOOK_REPLAY_TTL', 7 * 24 * 3600))
+    # Сразу перечитывать due_to у платёжного сервиса, а не ждать следующего запроса
+    refresh: bool = env_flag('PAYMENT_WEBHOOK_REFRESH', True)
 
 @dataclass
 class PaymentsConfig:
-    host: str = os.getenv('PAYMENT_HOST')
-    port: int = int(os.getenv('PAYMENT_PORT'))
+    host: str = required_env('PAYMENT_HOST')
+    port: int = required_int('PAYMENT_PORT')
+    # Пакетный маршрут due_to (POST {"user_ids": [...]} -> {user_id: due_to}), если есть
+    bulk_due_to_path: str = os.getenv('PAYMENT_BULK_DUE_TO_PATH')
     handler: PayHandlerConfig = None
     webhook: PayWebhookConfig = None
+    http: HttpClientConfig = None
+    breaker: BreakerConfig = None
+    hedging: HedgingConfig = None
 
     def __post_init__(self):
         if not self.handler: self.handler = PayHandlerConfig()
         if not self.webhook:  self.webhook = PayWebhookConfig()
+        if not self.http: self.http = HttpClientConfig.from_env('PAYMENT', timeout=10.0)
+        if not self.breaker: self.breaker = BreakerConfig.from_env('PAYMENT', slow_call_seconds=5.0)
+        if not self.hedging: self.hedging = HedgingConfig.from_env('PAYMENT')
 
 @dataclass
 class DatabaseConfig:
-    host: str = os.getenv('DATABASE_HOST')
-    port: int = int(os.getenv('DATABASE_PORT'))
-    prefix: str = os.getenv('DATABASE_PREFIX')
+    host: str = required_env('DATABASE_HOST')
+    port: int = required_int('DATABASE_PORT')
+    prefix: str = required_env('DATABASE_PREFIX')
+    # Пакетные маршруты (POST {"user_ids": [...]} -> {user_id: ...}), если они есть
+    bulk_stats_path: str = os.getenv('DATABASE_BULK_STATS_PATH')
+    bulk_users_path: str = os.getenv('DATABASE_BULK_USERS_PATH')
+    # POST {"user_id": ..., "ops": [{"op": "save"|"delete", ...}]} для отложенной записи слов
+    bulk_words_path: str = os.getenv('DATABASE_BULK_WORDS_PATH')
+    # GET -> все публичные слова (список или {word_id: слово}) для индекса поиска
+    public_words_path: str = os.getenv('DATABASE_PUBLIC_WORDS_PATH')
+    # PUT ?user_id&word_id с аудиозаписью слова в теле
+    word_audio_path: str = os.getenv('DATABASE_WORD_AUDIO_PATH', '/words/audio')
+    # GET -> все занятые никнеймы / все user_id: первичное наполнение фильтров Блума
+    nicknames_path: str = os.getenv('DATABASE_NICKNAMES_PATH')
+    user_ids_path: str = os.getenv('DATABASE_USER_IDS_PATH')
+    http: HttpClientConfig = None
+    breaker: BreakerConfig = None
+    hedging: HedgingConfig = None
+
+    def __post_init__(self):
+        if not self.http: self.http = HttpClientConfig.from_env('DATABASE', timeout=5.0)
+        if not self.breaker: self.breaker = BreakerConfig.from_env('DATABASE', slow_call_seconds=3.0)
+        if not self.hedging: self.hedging = HedgingConfig.from_env('DATABASE')
+
+@dataclass
+class RedisConfig:
+    url: str = os.getenv('REDIS_URL', 'redis://redis')
+    max_connections: int = int(os.getenv('REDIS_MAX_CONNECTIONS', 100))
+    socket_timeout: float = float(os.getenv('REDIS_SOCKET_TIMEOUT', 0.25))
+    connect_timeout: float = float(os.getenv('REDIS_CONNECT_TIMEOUT', 0.5))
+    # Тела ответов от этого размера хранятся в Redis сжатыми (zlib)
+    compress_min_bytes: int = int(os.getenv('CACHE_COMPRESS_MIN_BYTES', 8 * 1024))
+    compress_level: int = int(os.getenv('CACHE_COMPRESS_LEVEL', 1))
+
+@dataclass
+class LocalCacheConfig:
+    """ Локальный (в памяти процесса) кэш перед Redis """
+    max_entries: int = int(os.getenv('LOCAL_CACHE_MAX_ENTRIES', 10_000))
+    max_bytes: int = int(os.getenv('LOCAL_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    # TTL в секундах по пространствам имён; 0 отключает локальный кэш
+    ttls: dict = None
+
+    def __post_init__(self):
+        if self.ttls is None:
+            self.ttls = {
+                'words': float(os.getenv('LOCAL_CACHE_WORDS_TTL', 30)),
+                'search_words': float(os.getenv('LOCAL_CACHE_SEARCH_TTL', 30)),
+                'stats': float(os.getenv('LOCAL_CACHE_STATS_TTL', 30)),
+                'user': float(os.getenv('LOCAL_CACHE_USER_TTL', 60)),
+                'due_to': float(os.getenv('LOCAL_CACHE_DUE_TO_TTL', 30)),
+            }
+
+@dataclass
+class ProxyConfig:
+    """ Потоковая отдача больших ответов апстрима """
+    # Ответы от этого размера (или без Content-Length) отдаются потоком
+    stream_min_bytes: int = int(os.getenv('PROXY_STREAM_MIN_BYTES', 256 * 1024))
+    # Ответы больше этого размера в кэш не кладутся
+    cache_max_bytes: int = int(os.getenv('PROXY_CACHE_MAX_BYTES', 8 * 1024 * 1024))
+    # Загрузки (аудио слов) больше этого размера отклоняются с 413
+    upload_max_bytes: int = int(os.getenv('UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
+
+@dataclass
+class BatchConfig:
+    """ Пакетные маршруты (/batch) """
+    max_size: int = int(os.getenv('BATCH_MAX_SIZE', 500))
+    concurrency: int = int(os.getenv('BATCH_CONCURRENCY', 16))
+
+@dataclass
+class RateLimitConfig:
+    """
+    Ограничение нагрузки: токен-бакет в Redis на пару (маршрут, адрес
+    клиента) и общий предел одновременно обрабатываемых запросов процесса.
+    """
+    # Выключено по умолчанию: основной клиент — бот, и все его пользователи
+    # приходят с одного адреса
+    enabled: bool = env_flag('RATE_LIMIT', False)
+    # Запросов в секунду и размер всплеска по умолчанию для любого маршрута
+    rate: float = float(os.getenv('RATE_LIMIT_RATE', 20))
+    burst: int = int(os.getenv('RATE_LIMIT_BURST', 40))
+    # Переопределения по маршрутам: RATE_LIMIT_ROUTES="/api/words=5:10;/api/users=10:20"
+    routes: dict = None
+    # Служебные маршруты не ограничиваются
+    exempt: tuple = (
+        '/api/breakers', '/api/upstreams', '/api/cache/stats', '/api/outbox', '/metrics',
+        '/docs', '/openapi.json', *filter(None, [os.getenv('PAYMENT_WEBHOOK_PREFIX')])
+    )
+    # Доверенные клиенты без лимита: RATE_LIMIT_TRUSTED="10.0.0.5,10.0.0.6"
+    trusted: tuple = tuple(
+        filter(None, (ip.strip() for ip in os.getenv('RATE_LIMIT_TRUSTED', '').split(',')))
+    )
+    # На процесс: при WORKERS > 1 общий предел — воркеры × MAX_IN_FLIGHT.
+    # 0 отключает сброс нагрузки
+    max_in_flight: int = int(os.getenv('MAX_IN_FLIGHT', 512))
+    shed_retry_after: int = int(os.getenv('SHED_RETRY_AFTER', 1))
+
+    def __post_init__(self):
+        if self.routes is None:
+            # Пакетные маршруты дороже обычных в десятки раз
+            self.routes = {
+                '/api/words/stats/batch': (2.0, 5),
+                '/api/due_to/batch': (2.0, 5),
+                '/api/users/batch': (2.0, 5),
+            }
+            for item in filter(None, os.getenv('RATE_LIMIT_ROUTES', '').split(';')):
+                path, _, limit = item.partition('=')
+                rate, _, burst = limit.partition(':')
+                self.routes[path.strip()] = (float(rate), int(burst or rate))
+
+    def limit_for(self, path: str) -> tuple:
+        return self.routes.get(path, (self.rate, self.burst))
+
+@dataclass
+class TimingConfig:
+    """ Разбивка времени запроса по фазам и журнал медленных запросов """
+    server_timing: bool = env_flag('SERVER_TIMING', True)
+    # Запросы дольше порога пишутся в журнал с разбивкой по фазам; 0 отключает
+    slow_request_ms: float = float(os.getenv('SLOW_REQUEST_MS', 500))
+
+@dataclass
+class ServerConfig:
+    """ Параметры продакшен-сервера (см. src/server.py) """
+    # 0 — по числу ядер
+    workers: int = int(os.getenv('WORKERS', 0))
+    backlog: int = int(os.getenv('SERVER_BACKLOG', 2048))
+    # Дольше таймаута простоя балансировщика, чтобы соединение закрывал он
+    keep_alive: int = int(os.getenv('SERVER_KEEP_ALIVE', 75))
+    # Сколько ждать завершения запросов в обработке при остановке
+    graceful_timeout: int = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', 30))
+    # Перезапуск воркера после стольких запросов; 0 отключает
+    max_requests: int = int(os.getenv('SERVER_MAX_REQUESTS', 0))
+    access_log: bool = env_flag('SERVER_ACCESS_LOG')
+    proxy_headers: bool = env_flag('SERVER_PROXY_HEADERS', True)
+    # Чьим X-Forwarded-For верить: адреса или подсети балансировщика через
+    # запятую. Адрес клиента — идентичность для лимитов запросов, поэтому
+    # по умолчанию доверяем только локальному прокси, а не '*'
+    forwarded_allow_ips: str = os.getenv('SERVER_FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+    @property
+    def worker_count(self) -> int:
+        return self.workers or os.cpu_count() or 1
+
+@dataclass
+class OutboxConfig:
+    """ Фоновая обработка побочных действий через Redis Streams (см. src/outbox) """
+    enabled: bool = env_flag('OUTBOX', True)
+    batch_size: int = int(os.getenv('OUTBOX_BATCH', 32))
+    concurrency: int = int(os.getenv('OUTBOX_CONCURRENCY', 8))
+    poll_interval: float = float(os.getenv('OUTBOX_POLL_INTERVAL', 0.2))
+    retry_scan_interval: float = float(os.getenv('OUTBOX_RETRY_SCAN_INTERVAL', 1.0))
+    error_delay: float = 1.0
+    max_attempts: int = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+    # Пауза перед повтором: base * 2^(попытка - 1), не больше cap (секунды)
+    backoff_base: float = float(os.getenv('OUTBOX_BACKOFF', 2.0))
+    backoff_cap: float = float(os.getenv('OUTBOX_BACKOFF_CAP', 300.0))
+    # Сколько запись считается занятой одним потребителем (дольше таймаута апстрима)
+    lease: float = float(os.getenv('OUTBOX_LEASE', 30.0))
+    # Сколько помнить выполненные действия для идемпотентности (секунды)
+    done_ttl: int = int(os.getenv('OUTBOX_DONE_TTL', 30 * 24 * 3600))
+    stream_maxlen: int = int(os.getenv('OUTBOX_MAXLEN', 100_000))
+
+@dataclass
+class BloomConfig:
+    """ Фильтры Блума занятых никнеймов и известных user_id (см. src/cache/bloom.py) """
+    enabled: bool = env_flag('BLOOM', True)
+    capacity: int = int(os.getenv('BLOOM_CAPACITY', 1_000_000))
+    error_rate: float = float(os.getenv('BLOOM_ERROR_RATE', 0.01))
+    # Как часто сверять локальную копию с Redis (секунды)
+    refresh_interval: float = float(os.getenv('BLOOM_REFRESH', 60))
+    retry_delay: float = float(os.getenv('BLOOM_RETRY_DELAY', 5.0))
+    # Сколько одна реплика может строить фильтр, прежде чем за это возьмётся другая
+    build_lock: int = int(os.getenv('BLOOM_BUILD_LOCK', 600))
+    # Как часто перестраивать фильтр из полного списка (секунды): столько
+    # самое большее (плюс BLOOM_REFRESH) живёт ложное «точно нет» для записи,
+    # созданной в обход шлюза или не попавшей в фильтр. 0 — не перестраивать
+    rebuild_interval: int = int(os.getenv('BLOOM_REBUILD', 3600))
+
+@dataclass
+class WordIndexConfig:
+    """ Индекс публичных слов в памяти процесса для поиска и автодополнения """
+    enabled: bool = env_flag('WORD_INDEX', True)
+    # Полная перезагрузка индекса страхует от пропущенных событий (секунды)
+    reload_interval: float = float(os.getenv('WORD_INDEX_RELOAD', 600))
+    # Загрузка после записи публичного слова с неизвестным id (секунды):
+    # записи за это время собираются в одну загрузку
+    stale_delay: float = float(os.getenv('WORD_INDEX_STALE_DELAY', 5.0))
+    retry_delay: float = float(os.getenv('WORD_INDEX_RETRY_DELAY', 5.0))
+    max_results: int = int(os.getenv('WORD_INDEX_MAX_RESULTS', 100))
+    autocomplete_limit: int = int(os.getenv('WORD_INDEX_AUTOCOMPLETE_LIMIT', 10))
+
+@dataclass
+class WriteThroughConfig:
+    """ Правка закэшированного словаря и статистики на месте после записи слова """
+    enabled: bool = env_flag('WORDS_WRITE_THROUGH', True)
+    # Счётчики в ответе /words/stats: всего слов и публичных ('' — не считать)
+    stats_total_field: str = os.getenv('STATS_TOTAL_FIELD', 'total')
+    stats_public_field: str = os.getenv('STATS_PUBLIC_FIELD', 'public')
+
+@dataclass
+class WriteBehindConfig:
+    """ Отложенная запись слов словаря: ответ 202 сразу, запись в БД пачками в фоне """
+    enabled: bool = env_flag('WORDS_WRITE_BEHIND', False)
+    # Страховочный срок жизни списка ещё не записанных изменений пользователя (секунды)
+    pending_ttl: int = int(os.getenv('WORDS_WRITE_BEHIND_PENDING_TTL', 24 * 3600))
+
+@dataclass
+class CachePolicy:
+    """
+    Политика кэширования маршрута. В режиме stale-while-revalidate запись
+    после soft_ttl отдаётся как устаревшая и обновляется в фоне, а из Redis
+    удаляется только по hard_ttl. Без него оба срока совпадают.
+
+    После hard_ttl запись ещё fallback_ttl хранится в Redis как запасная:
+    её отдают, только если апстрим недоступен (разомкнута цепь, ошибка сети).
+    """
+    soft_ttl: timedelta
+    hard_ttl: timedelta = None
+    swr: bool = False
+    fallback_ttl: timedelta = timedelta(seconds=int(os.getenv('CACHE_FALLBACK_TTL', 86400)))
+
+    def __post_init__(self):
+        if not self.swr or self.hard_ttl is None or self.hard_ttl < self.soft_ttl:
+            self.hard_ttl = self.soft_ttl
+
+    @property
+    def storage_ttl(self) -> timedelta:
+        """ Сколько запись живёт в Redis с учётом запасного окна """
+        return self.hard_ttl + self.fallback_ttl
 
 @dataclass
 class Config:
 
-    host: str = os.getenv('THIS_HOST')
-    port: int = int(os.getenv('THIS_PORT'))
+    host: str = required_env('THIS_HOST')
+    port: int = required_int('THIS_PORT')
 
     payments: PaymentsConfig = None
     database: DatabaseConfig = None
+    redis: RedisConfig = None
+    local_cache: LocalCacheConfig = None
+    batch: BatchConfig = None
+    proxy: ProxyConfig = None
+    rate_limit: RateLimitConfig = None
+    timing: TimingConfig = None
+    server: ServerConfig = None
+    outbox: OutboxConfig = None
+    word_index: WordIndexConfig = None
+    bloom: BloomConfig = None
+    write_through: WriteThroughConfig = None
+    write_behind: WriteBehindConfig = None
     tz_info: datetime = timezone(timedelta(hours=3.0))
 
     words_ttl = timedelta(minutes=30)
+    words_cache = CachePolicy(
+        words_ttl, timedelta(hours=6), swr=env_flag('WORDS_CACHE_SWR', True)
+    )
+    search_cache = CachePolicy(
+        words_ttl, timedelta(hours=2), swr=env_flag('SEARCH_CACHE_SWR', False)
+    )
+    stats_cache = CachePolicy(
+        words_ttl, timedelta(hours=6), swr=env_flag('STATS_CACHE_SWR', True)
+    )
+    # С вебхуком платёжного сервиса срок подписки сбрасывается сразу при
+    # изменении, поэтому его можно держать в кэше часами
+    due_to_ttl = timedelta(seconds=int(os.getenv(
+        'DUE_TO_TTL', 6 * 3600 if os.getenv('PAYMENT_WEBHOOK_SECRET') else 900
+    )))
+    due_to_cache = CachePolicy(
+        due_to_ttl, max(due_to_ttl, timedelta(hours=1)), swr=env_flag('DUE_TO_CACHE_SWR', True)
+    )
+    user_cache = CachePolicy(
+        timedelta(hours=1), timedelta(hours=6), swr=env_flag('USER_CACHE_SWR', False)
+    )
+    # Пустые ответы и «не существует» кэшируются коротко
+    negative_ttl = timedelta(seconds=int(os.getenv('NEGATIVE_CACHE_TTL', 30)))
+    exists_cache = CachePolicy(negative_ttl, fallback_ttl=timedelta(0))
+    flight_lock_ttl = timedelta(seconds=5)
+    # Сколько single-flight держит ключ, пока потоковое тело заполняет кэш
+    flight_hold_ttl = timedelta(seconds=int(os.getenv('FLIGHT_HOLD_TTL', 60)))
 
     def __post_init__(self):
         if not self.payments: self.payments = PaymentsConfig()
         if not self.database: self.database = DatabaseConfig()
+        if not self.redis: self.redis = RedisConfig()
+        if not self.local_cache: self.local_cache = LocalCacheConfig()
+        if not self.batch: self.batch = BatchConfig()
+        if not self.proxy: self.proxy = ProxyConfig()
+        if not self.rate_limit: self.rate_limit = RateLimitConfig()
+        if not self.timing: self.timing = TimingConfig()
+        if not self.server: self.server = ServerConfig()
+        if not self.outbox: self.outbox = OutboxConfig()
+        if not self.word_index: self.word_index = WordIndexConfig()
+        if not self.bloom: self.bloom = BloomConfig()
+        if not self.write_through: self.write_through = WriteThroughConfig()
+        if not self.write_behind: self.write_behind = WriteBehindConfig()
+
+    def validate(self) -> None:
+        """ Падает с понятной ошибкой, если обязательные переменные окружения не заданы """
+        if _env_errors:
+            raise ConfigError('Invalid environment: ' + '; '.join(_env_errors))
 
-config = Config()
\ No newline at end of file
+config = Config()
@@ -1,51 +1,109 @@
+import asyncio
 import logging
-from json import loads, dumps
-from typing import Dict
+from json import dumps, loads
+from typing import Dict, List, Optional
 
 import httpx
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from fastapi.params import Query
-from redis.asyncio import Redis as aioredis
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 
+from src.cache import (
+    Passthrough, read_through, read_through_etag, cached_etag, read_many, relay,
+    set_blob, is_empty, negative, invalidate
+)
 from src.config import config
+from src.metrics import phase
 from src.models import Word
+from src.outbox import (
+    word_writes, apply_pending, apply_pending_stats, saved_word, sync_dictionary_cache
+)
+from src.search import word_index
+from src.upstream import CircuitOpenError, database
 
 logger = logging.getLogger('gateway')
 
-redis = aioredis.from_url("redis://redis")
-
 router = APIRouter(prefix='/api')
 
 
-DATABASE_BASE_URL = f"http://{config.database.host}:{config.database.port}"
+def dictionary_tags(user_id: int) -> tuple:
+    """ Теги кэша словаря: сбрасываются при любом изменении слов пользователя """
+    return f'user:{user_id}', f'dictionary:{user_id}'
+
+
+def json_response(body: bytes, etag: Optional[str] = None) -> Response:
+    return Response(
+        content=body, media_type='application/json',
+        headers={'ETag': f'"{etag}"'} if etag else None,
+    )
+
+
+def not_modified(etag: str) -> Response:
+    """ 304 на условный запрос: тело из кэша не читается и не отправляется """
+    return Response(status_code=304, headers={'ETag': f'"{etag}"'})
+
+
+async def pending_writes(user_id: int) -> list:
+    return await word_writes.pending(user_id) if config.write_behind.enabled else []
+
+
+async def pending_writes_many(user_ids: List[int]) -> dict:
+    return await word_writes.pending_many(user_ids) if config.write_behind.enabled else {}
+
 
 @router.get('/words')
 async def get_words_handler(
+        request: Request,
         user_id: int = Query(..., description="User ID")
 ):
     """ Перенаправляет запрос на получение слова пользователя """
+    key = f'words:{user_id}'
+    tags = dictionary_tags(user_id)
+
+    async def fetch_words():
+        url = config.database.prefix + f'/words?user_id={user_id}'
+        resp = await database.stream('GET', url=url)
+        if resp.status_code == 200:
+            # Большие словари отдаются потоком, без буферизации в шлюзе
+            return await relay(resp, key, config.words_cache, tags=tags)
+
+        else:
+            await resp.aread()
+            await resp.aclose()
+            raise HTTPException(
+                status_code=resp.status_code, detail=resp.text
+            )
+
     try:
-        cached = await redis.hgetall(f'words:{user_id}')
-        if cached:
-            return { key: loads(val) for key, val in cached.items() }
-
-        async with httpx.AsyncClient() as client:
-            url = DATABASE_BASE_URL + config.database.prefix + f'/words?user_id={user_id}'
-            resp = await client.get(url=url)
-            if resp.status_code == 200:
-                words = resp.json()
-                if words:
-                    key = f'words:{user_id}'
-                    mapping = {str(key): dumps(val) for key, val in words.items()}
-                    await redis.hset(key, mapping=mapping)
-                    await redis.expire(key, config.words_ttl)
-
-                return words
-
-            else:
-                raise HTTPException(
-                    status_code=resp.status_code, detail=resp.text
-                )
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match:
+            checked, pending = await asyncio.gather(
+                cached_etag(key, fetch_words, config.words_cache, if_none_match, tags=tags),
+                pending_writes(user_id),
+            )
+            if checked.etag and not pending:
+                return not_modified(checked.etag)
+            body, etag = await read_through_etag(
+                key, fetch_words, config.words_cache, tags=tags, checked=checked
+            )
+        else:
+            (body, etag), pending = await asyncio.gather(
+                read_through_etag(key, fetch_words, config.words_cache, tags=tags),
+                pending_writes(user_id),
+            )
+
+        if pending:
+            # Свои ещё не записанные изменения пользователь видит сразу;
+            # такое тело не совпадает с кэшем, и ETag у него нет
+            if isinstance(body, Passthrough):
+                body = b''.join([chunk async for chunk in body])
+            with phase('json'):
+                body, etag = apply_pending(body, pending), None
+        if isinstance(body, Passthrough):
+            return StreamingResponse(body, media_type='application/json')
+        return json_response(body, etag)
+    except CircuitOpenError as e:
+        raise e.as_http()
     except Exception as e:
         logger.error(f'Error in get_words_handler: {e}')
         raise HTTPException(status_code=500, detail='Internal Server Error')
@@ -54,23 +112,32 @@ async def get_words_handler(
 @router.post('/words')
 async def save_word_handler(word_data: Word):
     try:
-        async with httpx.AsyncClient() as client:
-            url = DATABASE_BASE_URL + config.database.prefix + '/words'
-            headers = {'content-type': 'application/json'}
-            resp = await client.post(
-                url=url,
-                headers=headers,
-                content=word_data.model_dump_json()
+        url = config.database.prefix + '/words'
+        headers = {'content-type': 'application/json'}
+        with phase('json'):
+            content = word_data.model_dump_json()
+        if config.write_behind.enabled:
+            op_id = await word_writes.submit(word_data.user_id, 'save', payload=content)
+            if op_id:
+                return JSONResponse({'status': 'accepted', 'op_id': op_id}, status_code=202)
+            # Очередь недоступна — пишем синхронно
+
+        resp = await database.post(
+            url=url,
+            headers=headers,
+            content=content
+        )
+        if resp.status_code == 200:
+            with phase('json'):
+                word = word_data.model_dump(mode='json', exclude={'audio'})
+                saved = saved_word(resp, word) or (None, word)
+            await sync_dictionary_cache(word_data.user_id, 'save', *saved)
+            return 200
+
+        else:
+            raise HTTPException(
+                status_code=resp.status_code, detail=resp.text
             )
-            if resp.status_code == 200:
-                user_id=word_data.user_id
-                await redis.delete(f'words:{user_id}', f'stats:{user_id}')
-                return 200
-
-            else:
-                raise HTTPException(
-                    status_code=resp.status_code, detail=resp.text
-                )
     except Exception as e:
         logger.error(f'Error in save_word_handler: {e}')
         raise HTTPException(status_code=500, detail='Internal Server Error')
@@ -82,79 +149,241 @@ async def api_delete_word_handler(
     word_id: int = Query(..., description="Word ID which it goes by in DB"),
 ):
     try:
-        async with httpx.AsyncClient() as client:
-            url = DATABASE_BASE_URL + config.database.prefix + f'/words?user_id={user_id}&word_id={word_id}'
-            resp = await client.delete(url=url)
-            if resp.status_code == 200:
-                await redis.delete(f'words:{user_id}', f'stats:{user_id}')
-                return 200
-            else:
-                raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        if config.write_behind.enabled:
+            op_id = await word_writes.submit(user_id, 'delete', word_id=str(word_id))
+            if op_id:
+                return JSONResponse({'status': 'accepted', 'op_id': op_id}, status_code=202)
+
+        url = config.database.prefix + f'/words?user_id={user_id}&word_id={word_id}'
+        resp = await database.delete(url=url)
+        if resp.status_code == 200:
+            await sync_dictionary_cache(user_id, 'delete', word_id)
+            return 200
+        else:
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
 
     except Exception as e:
         logger.error(f"Error in api_delete_word_handler: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+class UploadTooLarge(Exception):
+    pass
+
+
+@router.put("/words/audio")
+async def upload_word_audio_handler(
+        request: Request,
+        user_id: int = Query(..., description="User ID"),
+        word_id: int = Query(..., description="Word ID which it goes by in DB"),
+):
+    """
+    Аудиозапись слова сырым телом запроса (метаданные слова — отдельно,
+    через POST /words). Тело потоком уходит в database-сервис и целиком
+    в памяти шлюза не собирается; больше UPLOAD_MAX_BYTES — 413.
+    """
+    limit = config.proxy.upload_max_bytes
+    length = request.headers.get('content-length')
+    if length is not None:
+        try:
+            size = int(length)
+        except ValueError:
+            size = -1
+        if size < 0:
+            raise HTTPException(status_code=400, detail='Invalid Content-Length')
+        if size > limit:
+            raise HTTPException(status_code=413, detail=f'Audio is larger than {limit} bytes')
+
+    async def body():
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            # Content-Length мог отсутствовать или соврать — считаем сами
+            if received > limit:
+                raise UploadTooLarge()
+            yield chunk
+
+    headers = {'content-type': request.headers.get('content-type', 'application/octet-stream')}
+    if length is not None:
+        headers['content-length'] = length
+    url = config.database.prefix + config.database.word_audio_path + \
+        f'?user_id={user_id}&word_id={word_id}'
+    try:
+        resp = await database.put(url=url, headers=headers, content=body())
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail=f'Audio is larger than {limit} bytes')
+    except CircuitOpenError as e:
+        raise e.as_http()
+
+    if resp.status_code >= 300:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+    await invalidate(tags=[f'dictionary:{user_id}'])
+    return 200
+
+
 @router.get("/words/search")
 async def api_search_word_handler(
         word: str = Query(..., description="Слово для поиска среди пользователей"),
         user_id: int = Query(None, description="User ID пользователя"),
+        prefix: bool = Query(False, description="Искать слова, начинающиеся с word"),
 ):
-    try:
-        user_id = user_id if user_id else 'null'
-        cached = await redis.hgetall(f'search_words:{word}:{user_id}')
-        if cached:
-            return {str(key): loads(val) for key, val in cached.items()}
+    if word_index.ready:
+        # Публичные слова уже в памяти процесса: ни Redis, ни database-сервис не нужны
+        with phase('search'):
+            body = word_index.search(word, prefix=prefix, exclude_user=user_id)
+        return Response(content=body, media_type='application/json')
+    if prefix:
+        raise HTTPException(status_code=503, detail='Word index is not ready')
+
+    tags = dictionary_tags(user_id) if user_id else ()
+    user_id = user_id if user_id else 'null'
+    key = f'search_words:{word}:{user_id}'
 
+    async def fetch_search():
         # Ищем слово от пользователя
-        async with httpx.AsyncClient() as client:
-            url = DATABASE_BASE_URL + config.database.prefix + f'/words/search?user_id={user_id}&word={word}'
-            resp = await client.get(url=url)
-            if resp.status_code == 200:
-                words = resp.json()
-                if words:
-                    mapping = {key: dumps(val) for key, val in words.items()}
-                    await redis.hset(f'search_words:{word}:{user_id}', mapping=mapping)
-                    await redis.expire(f'search_words:{word}:{user_id}', config.words_ttl)
-
-                return words
-            else:
-                raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        url = config.database.prefix + f'/words/search?user_id={user_id}&word={word}'
+        resp = await database.get(url=url)
+        if resp.status_code == 200:
+            policy = config.search_cache
+            await set_blob(
+                key, resp.content, negative(policy) if is_empty(resp.content) else policy,
+                tags=tags
+            )
+            return resp.content
+        else:
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
 
+    try:
+        body = await read_through(key, fetch_search, config.search_cache, tags=tags)
+        return Response(content=body, media_type='application/json')
+
+    except CircuitOpenError as e:
+        raise e.as_http()
     except Exception as e:
         logger.error(f"Error in api_search_word_handler: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
 
+@router.get("/words/autocomplete")
+async def api_autocomplete_handler(
+        prefix: str = Query(..., min_length=1, description="Начало слова"),
+        limit: int = Query(None, ge=1, le=100, description="Сколько вариантов вернуть"),
+):
+    """ Варианты публичных слов по началу слова из индекса в памяти """
+    if not word_index.ready:
+        raise HTTPException(status_code=503, detail='Word index is not ready')
+    with phase('search'):
+        return word_index.complete(prefix, limit or config.word_index.autocomplete_limit)
+
+
+async def fetch_stats(user_id: int) -> bytes:
+    """ Запрашивает статистику слов у database-сервиса и кладёт её в кэш """
+    url = config.database.prefix + f'/words/stats?user_id={user_id}'
+    resp = await database.get(url=url)
+    if resp.status_code == 200:
+        if not is_empty(resp.content):
+            await set_blob(
+                f'stats:{user_id}', resp.content, config.stats_cache,
+                tags=dictionary_tags(user_id)
+            )
+
+        return resp.content
+
+    else:
+        raise HTTPException(
+            status_code=resp.status_code, detail=resp.text
+        )
+
+
+async def fetch_stats_bulk(user_ids: List[int]) -> Dict[int, Optional[bytes]]:
+    """ Статистика сразу нескольких пользователей одним запросом к database-сервису """
+    url = config.database.prefix + config.database.bulk_stats_path
+    resp = await database.post(url=url, json={'user_ids': user_ids})
+    if resp.status_code != 200:
+        raise HTTPException(status_code=resp.status_code, detail=resp.text)
+
+    # Пакетный ответ приходится разобрать, чтобы разложить его по пользователям
+    with phase('json'):
+        data = resp.json()
+        result = {
+            user_id: dumps(stats).encode() if (stats := data.get(str(user_id))) else None
+            for user_id in user_ids
+        }
+    await asyncio.gather(*(
+        set_blob(
+            f'stats:{user_id}', body, config.stats_cache, tags=dictionary_tags(user_id)
+        )
+        for user_id, body in result.items() if body
+    ))
+    return result
+
+
 @router.get("/words/stats")
 async def api_stats_handler(
+        request: Request,
         user_id: int = Query(..., description="USer ID")
 ):
-    """ Обработчик статистики слов пользователя """
-    cached = await redis.hgetall(f'stats:{user_id}')
-    if cached:
-        return cached
-
+    """
+    Обработчик статистики слов пользователя. Как и в GET /api/words,
+    счётчики учитывают его ещё не записанные изменения (WORDS_WRITE_BEHIND)
+    """
+    key = f'stats:{user_id}'
+    fetch = lambda: fetch_stats(user_id)
     try:
-        async with httpx.AsyncClient() as client:
-            url = DATABASE_BASE_URL + config.database.prefix + f'/words/stats?user_id={user_id}'
-            resp = await client.get(url=url)
-            if resp.status_code == 200:
-                stats = resp.json()
-                if stats:
-                    await redis.hset(f'stats:{user_id}', mapping=stats)
-                    await redis.expire(f'stats:{user_id}', config.words_ttl)
-
-                return stats
-
-            else:
-                raise HTTPException(
-                    status_code=resp.status_code, detail=resp.text
-                )
+        pending = []
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match:
+            checked, pending = await asyncio.gather(
+                cached_etag(key, fetch, config.stats_cache, if_none_match, tags=dictionary_tags(user_id)),
+                pending_writes(user_id),
+            )
+            if checked.etag and not pending:
+                return not_modified(checked.etag)
+            body, etag = await read_through_etag(
+                key, fetch, config.stats_cache, tags=dictionary_tags(user_id), checked=checked
+            )
+        else:
+            (body, etag), pending = await asyncio.gather(
+                read_through_etag(key, fetch, config.stats_cache, tags=dictionary_tags(user_id)),
+                pending_writes(user_id),
+            )
+
+        if pending:
+            with phase('json'):
+                body, etag = apply_pending_stats(body, pending, config.write_through), None
+        return json_response(body, etag)
 
+    except CircuitOpenError as e:
+        raise e.as_http()
     except Exception as e:
         logger.error(f"Error in api_stats_handler: {str(e)}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@router.get("/words/stats/batch")
+async def api_stats_batch_handler(
+        user_ids: List[int] = Query(
+            ..., description="User IDs", max_length=config.batch.max_size
+        )
+):
+    """ Статистика слов сразу нескольких пользователей, по статусу на каждого """
+    body, pending = await asyncio.gather(read_many(
+        user_ids,
+        key_for=lambda user_id: f'stats:{user_id}',
+        fetch_one=fetch_stats,
+        policy=config.stats_cache,
+        concurrency=config.batch.concurrency,
+        tags=dictionary_tags,
+        fetch_bulk=fetch_stats_bulk if config.database.bulk_stats_path else None,
+    ), pending_writes_many(user_ids))
+    if pending:
+        # Пакет разбирается, только если у кого-то есть незаписанные изменения
+        with phase('json'):
+            items = loads(body)
+            for user_id, ops in pending.items():
+                item = items.get(str(user_id))
+                if item and item.get('data') is not None:
+                    data = dumps(item['data']).encode()
+                    item['data'] = loads(apply_pending_stats(data, ops, config.write_through))
+            body = dumps(items).encode()
+    return Response(content=body, media_type='application/json')
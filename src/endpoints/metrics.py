@@ -0,0 +1,14 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from src.metrics import registry
+
+router = APIRouter()
+
+
+@router.get('/metrics', response_class=PlainTextResponse)
+async def metrics():
+    """ Метрики процесса в текстовом формате Prometheus """
+    return PlainTextResponse(
+        registry.render(), media_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,40 @@
+from fastapi import APIRouter
+
+from src.cache import bloom_filters, local_cache
+from src.outbox import outboxes
+from src.search import word_index
+from src.upstream import upstreams
+
+# Служебные маршруты: состояние процесса для эксплуатации, не для клиентов
+router = APIRouter(prefix='/api')
+
+
+@router.get("/breakers")
+async def breakers_state():
+    """ Состояние автоматов размыкания цепи апстримов """
+    return {upstream.name: upstream.breaker.snapshot() for upstream in upstreams}
+
+
+@router.get("/upstreams")
+async def upstreams_stats():
+    """ Счётчики пулов соединений и дополнительных попыток к апстримам """
+    return {
+        upstream.name: {**upstream.stats.as_dict(), 'hedging': upstream.hedger.snapshot()}
+        for upstream in upstreams
+    }
+
+
+@router.get("/outbox")
+async def outbox_stats():
+    """ Очереди фоновых действий: длина, неподтверждённые записи, dead-letter """
+    return {outbox.name: await outbox.snapshot() for outbox in outboxes}
+
+
+@router.get("/cache/stats")
+async def cache_stats():
+    """ Счётчики локального кэша процесса, индекс публичных слов и фильтры Блума """
+    return {
+        **local_cache.as_dict(),
+        'word_index': word_index.snapshot(),
+        'bloom': {bloom.name: bloom.snapshot() for bloom in bloom_filters},
+    }
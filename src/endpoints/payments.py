@@ -1,39 +1,36 @@
-import json
+import asyncio
 import logging
-from json import loads
+from json import dumps
+from typing import Dict, List, Optional
 
-import httpx
 from fastapi import HTTPException, APIRouter
 from fastapi.params import Query
-from redis.asyncio import Redis as aioredis
+from fastapi.responses import Response
 
+from src.cache import read_through, read_many, set_blob, is_empty, invalidate
 from src.config import config
+from src.metrics import phase
 from src.models import Payment
+from src.upstream import CircuitOpenError, database, payments
 
 logger = logging.getLogger('gateway')
 
-redis = aioredis.from_url("redis://redis")
-
 router = APIRouter(prefix='/api')
 
-PAYMENT_BASE_URL = f"http://{config.payments.host}:{config.payments.port}"
-
 
 @router.get("/test_connection")
 async def test_connection():
     """Тест соединения с database-сервисом"""
     try:
-        async with (httpx.AsyncClient() as client):
-            url = f"http://{config.database.host}:{config.database.port}" + \
-                  f"{config.database.prefix}/health"
-
-            logger.info(f"Testing connection to: {url}")
-            response = await client.get(url, timeout=5.0)
-            return {
-                "status": "success",
-                "database_url": url,
-                "response": response.text
-            }
+        url = f"{config.database.prefix}/health"
+
+        logger.info(f"Testing connection to: {database.base_url}{url}")
+        response = await database.get(url)
+        return {
+            "status": "success",
+            "database_url": database.base_url + url,
+            "response": response.text
+        }
     except Exception as e:
         logger.error(f"Connection test failed: {e}")
         return {
@@ -44,61 +41,105 @@ async def test_connection():
         }
 
 
+async def fetch_due_to(user_id) -> bytes:
+    """ Запрашивает срок подписки у платёжного сервиса и кладёт его в кэш """
+    url = f"{config.payments.handler.prefix}/due_to?user_id={user_id}"
+    response = await payments.get(url=url)
+    if response.status_code == 200:
+        if not is_empty(response.content):
+            await set_blob(
+                f'due_to:{user_id}', response.content, config.due_to_cache,
+                tags=[f'user:{user_id}']
+            )
+
+        return response.content # Либо словарь, либо null
+    return b'null'
+
+
+async def fetch_due_to_bulk(user_ids: List[int]) -> Dict[int, Optional[bytes]]:
+    """ Сроки подписок сразу нескольких пользователей одним запросом """
+    url = config.payments.handler.prefix + config.payments.bulk_due_to_path
+    response = await payments.post(url=url, json={'user_ids': user_ids})
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+
+    # Пакетный ответ приходится разобрать, чтобы разложить его по пользователям
+    with phase('json'):
+        data = response.json()
+        result = {
+            user_id: dumps(due_to).encode() if (due_to := data.get(str(user_id))) else None
+            for user_id in user_ids
+        }
+    await asyncio.gather(*(
+        set_blob(
+            f'due_to:{user_id}', body, config.due_to_cache, tags=[f'user:{user_id}']
+        )
+        for user_id, body in result.items() if body
+    ))
+    return result
+
+
 @router.get("/due_to")
 async def get_users_due_to(user_id = Query(..., description="User ID")):
 
-    cached = await redis.hgetall(f'due_to:{user_id}')
-    if cached:
-        return { key: loads(val) for key, val in cached.items() }
-
-    async with httpx.AsyncClient() as client:
-        url = PAYMENT_BASE_URL + f"{config.payments.handler.prefix}/due_to?user_id={user_id}"
-        try:
-            response = await client.get(
-                url=url,
-                timeout=5.0
-            )
-            if response.status_code == 200:
-                if data := response.json():
-                    mapping = {key: json.dumps(value) for key, value in data.items()}
-                    await redis.hset(f'due_to:{user_id}', mapping=mapping)
-                    await redis.expire(f'due_to:{user_id}', 900)
+    try:
+        body = await read_through(
+            f'due_to:{user_id}', lambda: fetch_due_to(user_id),
+            config.due_to_cache, tags=[f'user:{user_id}']
+        )
+        return Response(content=body, media_type='application/json')
+
+    except CircuitOpenError as e:
+        raise e.as_http()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to update DB: {e}")
 
-                return data # Возвращает либо словарь, либо null
 
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to update DB: {e}")
+@router.get("/due_to/batch")
+async def get_users_due_to_batch(
+        user_ids: List[int] = Query(
+            ..., description="User IDs", max_length=config.batch.max_size
+        )
+):
+    """ Сроки подписок нескольких пользователей, по статусу на каждого """
+    body = await read_many(
+        user_ids,
+        key_for=lambda user_id: f'due_to:{user_id}',
+        fetch_one=fetch_due_to,
+        policy=config.due_to_cache,
+        concurrency=config.batch.concurrency,
+        tags=lambda user_id: [f'user:{user_id}'],
+        fetch_bulk=fetch_due_to_bulk if config.payments.bulk_due_to_path else None,
+    )
+    return Response(content=body, media_type='application/json')
 
 
 @router.get('/yookassa_link')
 async def get_yookassa_link(
         user_id: int = Query(..., description="User ID")
 ) -> str:
-    async with httpx.AsyncClient() as client:
-        url = PAYMENT_BASE_URL + config.payments.handler.prefix + f'/link?user_id={user_id}'
-        try:
-            response = await client.get(url, timeout=5.0)
-            return response.json()
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Failed to receive link: {e}")
+    url = config.payments.handler.prefix + f'/link?user_id={user_id}'
+    try:
+        response = await payments.get(url)
+        return response.json()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to receive link: {e}")
 
 
 @router.post("/create_payment")
 async def create_payment(user_data: Payment):
     try:
-        async with httpx.AsyncClient() as client:
-            url = PAYMENT_BASE_URL + config.payments.handler.prefix + "/add"
-            response = await client.post(
-                url=url,
-                json=user_data.model_dump(),
-                timeout=10.0
-            )
-            await redis.delete(f'due_to:{user_data.user_id}')
-            if response.status_code == 200:
-                logger.info(f"Successfully posted: {response.status_code}")
-                return {"status": "success"}
-
-            return {"status": "failed", "error": response.status_code, "response": response.text}
+        url = config.payments.handler.prefix + "/add"
+        response = await payments.post(
+            url=url,
+            json=user_data.model_dump(),
+        )
+        await invalidate(f'due_to:{user_data.user_id}')
+        if response.status_code == 200:
+            logger.info(f"Successfully posted: {response.status_code}")
+            return {"status": "success"}
+
+        return {"status": "failed", "error": response.status_code, "response": response.text}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update DB: {e}")
@@ -1,39 +1,85 @@
-import json
+import asyncio
 import logging
-from json import loads
-from typing import Any, Union
+from json import dumps
+from typing import Any, Dict, List, Optional, Union
 
-import httpx
 from fastapi import APIRouter
 from fastapi import HTTPException
 from fastapi.params import Query
-from redis.asyncio import Redis as aioredis
+from fastapi.responses import Response
 
+from src.cache import (
+    BloomFilter, read_through, read_many, set_blob, is_empty, invalidate, count_lookup,
+    nicknames_bloom, users_bloom
+)
 from src.config import config
+from src.metrics import phase
 from src.models import User, Payment, Profile
-
-DATABASE_BASE_URL = f"http://{config.database.host}:{config.database.port}"
-PAYMENT_BASE_URL = f"http://{config.payments.host}:{config.payments.port}"
+from src.outbox import trial_payments, create_trial_payment
+from src.upstream import CircuitOpenError, database
 
 logger = logging.getLogger('gateway')
 
-redis = aioredis.from_url("redis://redis")
-
 router = APIRouter(prefix='/api')
 
 
 
+async def check_exists(key: str, url: str, bloom: BloomFilter, item: str, tags: list) -> bytes:
+    """
+    Проверка существования: «точно нет» от фильтра Блума отвечается без сети,
+    ответ «нет» от database-сервиса коротко кэшируется (теги сбрасываются при
+    создании пользователя или профиля), а «да» попадает в фильтр.
+    """
+    if not bloom.might_contain(item):
+        count_lookup(key, 'bloom')
+        return b'false'
+
+    async def fetch() -> bytes:
+        response = await database.get(url=url)
+        if response.status_code != 200:
+            raise HTTPException(status_code=500, detail="Error connecting to server")
+        if response.json():
+            if not bloom.has_bits(item):
+                await bloom.add(item)
+        else:
+            await set_blob(key, response.content, config.exists_cache, tags=tags)
+        return response.content
+
+    try:
+        return await read_through(key, fetch, config.exists_cache, tags=tags)
+    except CircuitOpenError as e:
+        raise e.as_http()
+
+
 @router.get("/nicknames")
 async def check_nickname_exists(
         nickname: str = Query(..., description="Some user`s nickname")
 ) -> bool:
-    async with httpx.AsyncClient() as client:
-        url = DATABASE_BASE_URL + config.database.prefix + \
-              f'/nickname_exists?nickname={nickname}'
-        response = await client.get(url=url, timeout=5.0)
-        if response.status_code == 200:
-            return response.json()
-        raise HTTPException(status_code=500, detail="Error connecting to server")
+    url = config.database.prefix + f'/nickname_exists?nickname={nickname}'
+    body = await check_exists(
+        f'nickname:{nickname}', url, nicknames_bloom, nickname, tags=[f'nickname:{nickname}']
+    )
+    return Response(content=body, media_type='application/json')
+
+
+def user_tags(user_id: int) -> list:
+    return [f'user:{user_id}', f'profile:{user_id}']
+
+
+async def fetch_user(user_id: int, target_field: str) -> bytes:
+    """ Запрашивает данные пользователя у database-сервиса и кладёт их в кэш """
+    url = config.database.prefix + \
+          f"/users?user_id={user_id}&target_field={target_field}"
+    response = await database.get(url=url)
+    if response.status_code == 200:
+        if not is_empty(response.content):
+            await set_blob(
+                f'user:{user_id}:{target_field}', response.content, config.user_cache,
+                tags=user_tags(user_id)
+            )
+        return response.content
+
+    return b'null'
 
 
 @router.get("/users")
@@ -43,67 +89,109 @@ async def get_user_via_gateway(
 ) -> dict[str, int] | Any:
 
     if target_field is None:
-        async with (httpx.AsyncClient() as client):
-            url = DATABASE_BASE_URL + config.database.prefix + \
-                f'/user_exists?user_id={user_id}'
-            response = await client.get(url=url, timeout=5.0)
-            if response.status_code == 200:
-                return response.json()
-            raise HTTPException(status_code=500, detail="Error connecting to server")
-
-    cached = await redis.hgetall(f'user:{user_id}:{target_field}')
-    if cached:
-        return {key: loads(val) for key, val in cached.items()}
+        url = config.database.prefix + f'/user_exists?user_id={user_id}'
+        body = await check_exists(
+            f'user_exists:{user_id}', url, users_bloom, str(user_id), tags=[f'user:{user_id}']
+        )
+        return Response(content=body, media_type='application/json')
 
     try:
-        async with httpx.AsyncClient() as client:
-            url = DATABASE_BASE_URL + config.database.prefix + \
-                  f"/users?user_id={user_id}&target_field={target_field}"
-            response = await client.get(
-                url=url,
-                timeout=5.0
-            )
-            if response.status_code == 200:
-                data = response.json()
-                mapping = {key: json.dumps(value) for key, value in data.items()}
-                await redis.hset(f'user:{user_id}:{target_field}', mapping=mapping)
-                return response
-
-            return None
-
+        body = await read_through(
+            f'user:{user_id}:{target_field}', lambda: fetch_user(user_id, target_field),
+            config.user_cache, tags=user_tags(user_id)
+        )
+        return Response(content=body, media_type='application/json')
+
+    except CircuitOpenError as e:
+        raise e.as_http()
     except Exception as e:
         logger.error(f'Failed to redirect request: {e}')
 
 
-@router.post("/users")
-async def create_user_via_gateway(user_data: User):
-    try:
-        async with httpx.AsyncClient() as client:
-            # 1. Создание пользователя в базе данных
-            database_url = DATABASE_BASE_URL + f"{config.database.prefix}/users"
-            headers = {"Content-Type": "application/json"}
-            resp = await client.post(
-                url=database_url,
-                headers=headers,
-                content=user_data.model_dump_json(),
-                timeout=10.0
-            )
-            await redis.delete(f'user:{user_data.user_id}')
-            logger.info(f"Successfully posted to database: {resp.status_code}")
-
-            # 2. Создание платежа в платежном сервисе
-            payment_url = PAYMENT_BASE_URL + f"{config.payments.handler.prefix}/add"
-            default_payment = Payment(user_id=user_data.user_id)
-            resp = await client.post(
-                url=payment_url,
-                headers=headers,
-                content=default_payment.model_dump_json(),
-                timeout=10.0
+@router.get("/users/batch")
+async def get_users_batch(
+        user_ids: List[int] = Query(
+            ..., description="User IDs", max_length=config.batch.max_size
+        ),
+        target_field: str = Query(..., description="What exactly the server looks for")
+):
+    """ Данные нескольких пользователей, по статусу на каждого """
+
+    async def fetch_bulk(missing: List[int]) -> Dict[int, Optional[bytes]]:
+        url = config.database.prefix + config.database.bulk_users_path
+        response = await database.post(
+            url=url, json={'user_ids': missing, 'target_field': target_field}
+        )
+        if response.status_code != 200:
+            raise HTTPException(status_code=response.status_code, detail=response.text)
+
+        # Пакетный ответ приходится разобрать, чтобы разложить его по пользователям
+        with phase('json'):
+            data = response.json()
+            result = {
+                user_id: dumps(value).encode() if (value := data.get(str(user_id))) else None
+                for user_id in missing
+            }
+        await asyncio.gather(*(
+            set_blob(
+                f'user:{user_id}:{target_field}', body, config.user_cache,
+                tags=user_tags(user_id)
             )
-            logger.info(f"Successfully posted to payment service: {resp.status_code}")
+            for user_id, body in result.items() if body
+        ))
+        return result
+
+    body = await read_many(
+        user_ids,
+        key_for=lambda user_id: f'user:{user_id}:{target_field}',
+        fetch_one=lambda user_id: fetch_user(user_id, target_field),
+        policy=config.user_cache,
+        concurrency=config.batch.concurrency,
+        tags=user_tags,
+        fetch_bulk=fetch_bulk if config.database.bulk_users_path else None,
+    )
+    return Response(content=body, media_type='application/json')
 
-            return {"status": "success"}
 
+@router.post("/users")
+async def create_user_via_gateway(user_data: User):
+    try:
+        # 1. Создание пользователя в базе данных
+        database_url = f"{config.database.prefix}/users"
+        headers = {"Content-Type": "application/json"}
+        with phase('json'):
+            content = user_data.model_dump_json()
+        resp = await database.post(
+            url=database_url,
+            headers=headers,
+            content=content,
+        )
+        await invalidate(tags=[f'user:{user_data.user_id}'])
+        if resp.status_code >= 300:
+            # Пользователь не создан — платёж для него заводить нельзя
+            logger.warning(f"Database rejected user {user_data.user_id}: {resp.status_code}")
+            raise HTTPException(status_code=resp.status_code, detail=resp.text)
+        await users_bloom.add(str(user_data.user_id))
+        logger.info(f"Successfully posted to database: {resp.status_code}")
+
+        # 2. Пробный платёж создаётся в фоне через outbox: регистрация
+        # не ждёт платёжный сервис, а его сбои повторяются потребителем
+        default_payment = Payment(user_id=user_data.user_id)
+        with phase('json'):
+            content = default_payment.model_dump_json()
+        fields = {'user_id': str(user_data.user_id), 'payload': content}
+        if not await trial_payments.enqueue(**fields):
+            # Redis недоступен — создаём платёж сразу, как раньше; пользователь
+            # уже создан, поэтому сбой платёжного сервиса регистрацию не отменяет
+            try:
+                await create_trial_payment(fields)
+            except Exception as e:
+                logger.error(f"Trial payment for user {user_data.user_id} failed: {e}")
+
+        return {"status": "success"}
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update DB: {e}")
 
@@ -115,29 +203,29 @@ async def update_user_profile(
     """ Обновляет информацию о пользователе """
     try:
         if isinstance(updated_data, User):
-            async with httpx.AsyncClient() as client:
-                database_url = DATABASE_BASE_URL + f"{config.database.prefix}/users"
-                headers = {"Content-Type": "application/json"}
-                resp = await client.post(
-                    url=database_url,
-                    headers=headers,
-                    json=updated_data.model_dump(),
-                    timeout=10.0
-                )
-                logger.info(f"Successfully updated user: {resp.status_code}")
-                await redis.delete(f'user:{updated_data.user_id}:users')
+            database_url = f"{config.database.prefix}/users"
+            headers = {"Content-Type": "application/json"}
+            resp = await database.post(
+                url=database_url,
+                headers=headers,
+                json=updated_data.model_dump(),
+            )
+            logger.info(f"Successfully updated user: {resp.status_code}")
+            await invalidate(tags=[f'profile:{updated_data.user_id}'])
         else:
-            async with httpx.AsyncClient() as client:
-                database_url = DATABASE_BASE_URL + f"{config.database.prefix}/profiles"
-                headers = {"Content-Type": "application/json"}
-                resp = await client.post(
-                    url=database_url,
-                    headers=headers,
-                    json=updated_data.model_dump(),
-                    timeout=10.0
-                )
-                logger.info(f"Successfully updated profile: {resp.status_code}")
-                await redis.delete(f'user:{updated_data.user_id}:profiles')
+            database_url = f"{config.database.prefix}/profiles"
+            headers = {"Content-Type": "application/json"}
+            resp = await database.post(
+                url=database_url,
+                headers=headers,
+                json=updated_data.model_dump(),
+            )
+            logger.info(f"Successfully updated profile: {resp.status_code}")
+            if resp.status_code < 300:
+                await nicknames_bloom.add(updated_data.nickname)
+            await invalidate(
+                tags=[f'profile:{updated_data.user_id}', f'nickname:{updated_data.nickname}']
+            )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating data: {e}")
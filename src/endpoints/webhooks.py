@@ -0,0 +1,115 @@
+import hashlib
+import hmac
+import logging
+import time
+from json import loads
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+
+from src.cache import redis, invalidate
+from src.cache.client import CACHE_ERRORS
+from src.config import config, PayWebhookConfig
+from src.metrics import webhook_events
+from .payments import fetch_due_to
+
+logger = logging.getLogger('gateway')
+
+router = APIRouter()
+
+
+def verify_signature(
+        body: bytes,
+        timestamp: Optional[str],
+        signature: Optional[str],
+        settings: PayWebhookConfig
+) -> None:
+    """
+    Подпись — hex HMAC-SHA256 от `{timestamp}.{тело}` общим секретом
+    (допускается префикс `sha256=`). Отметка времени ограничивает окно,
+    в котором перехваченный вызов можно повторить.
+    """
+    if not settings.secret:
+        raise HTTPException(status_code=503, detail='Webhook secret is not configured')
+    if not timestamp or not signature:
+        raise HTTPException(status_code=401, detail='Missing webhook signature')
+    try:
+        sent_at = int(timestamp)
+    except ValueError:
+        raise HTTPException(status_code=401, detail='Invalid webhook timestamp')
+    if abs(time.time() - sent_at) > settings.tolerance:
+        raise HTTPException(status_code=401, detail='Stale webhook timestamp')
+
+    expected = hmac.new(
+        settings.secret.encode(), f'{sent_at}.'.encode() + body, hashlib.sha256
+    ).hexdigest()
+    if not hmac.compare_digest(expected, signature.removeprefix('sha256=')):
+        raise HTTPException(status_code=401, detail='Invalid webhook signature')
+
+
+async def payment_webhook(request: Request):
+    """
+    Платёжный сервис сообщает об изменении статуса платежа:
+    {"event_id": ..., "user_id": ..., ...}. Срок подписки пользователя
+    сразу сбрасывается во всех кэшах и, если включено, перечитывается.
+    Событие отмечается обработанным только после успешного сброса; если
+    Redis недоступен, ответ 503, и платёжный сервис повторит вызов.
+    Повтор уже обработанного event_id подтверждается без действий.
+    """
+    settings = config.payments.webhook
+    body = await request.body()
+    try:
+        verify_signature(
+            body,
+            request.headers.get(settings.timestamp_header),
+            request.headers.get(settings.signature_header),
+            settings,
+        )
+    except HTTPException as e:
+        webhook_events.inc('payments', 'rejected')
+        logger.warning(f'Payment webhook rejected: {e.detail}')
+        raise
+
+    try:
+        event = loads(body)
+        event_id = str(event['event_id'])
+        user_id = int(event['user_id'])
+    except (ValueError, KeyError, TypeError):
+        webhook_events.inc('payments', 'rejected')
+        raise HTTPException(status_code=400, detail='Expected {"event_id": ..., "user_id": ...}')
+
+    replay_key = f'webhook:payments:{event_id}'
+    try:
+        seen = await redis.exists(replay_key)
+    except CACHE_ERRORS as e:
+        # Повтор не отличить, но сброс кэша безопасно выполнить и дважды
+        logger.warning(f'Payment webhook replay check skipped: {e}')
+        seen = False
+    if seen:
+        webhook_events.inc('payments', 'duplicate')
+        return {'status': 'duplicate'}
+
+    if not await invalidate(f'due_to:{user_id}'):
+        # Событие не отмечается обработанным: платёжный сервис повторит его
+        webhook_events.inc('payments', 'failed')
+        raise HTTPException(status_code=503, detail='Cache is unavailable, retry later')
+    if settings.refresh:
+        try:
+            await fetch_due_to(user_id)
+        except Exception as e:
+            # Ключ уже сброшен: следующий запрос сам сходит в платёжный сервис
+            logger.warning(f'due_to refresh for user {user_id} after webhook failed: {e}')
+
+    try:
+        await redis.set(replay_key, 'done', ex=settings.replay_ttl)
+    except CACHE_ERRORS as e:
+        # Сброс уже выполнен; повтор события лишь сбросит кэш ещё раз
+        logger.warning(f'Payment webhook {event_id} not recorded: {e}')
+
+    webhook_events.inc('payments', 'processed')
+    logger.info(f'Payment webhook {event_id}: due_to of user {user_id} updated')
+    return {'status': 'ok'}
+
+
+if config.payments.webhook.prefix:
+    router.add_api_route(config.payments.webhook.prefix, payment_webhook, methods=['POST'])
@@ -1,13 +1,64 @@
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
+from src.cache import invalidation_listener, drain_refreshes, close_redis, bloom_filters
 from src.config import config
 from src.endpoints.dictionary import router as dictionary_endpoints_router
+from src.endpoints.metrics import router as metrics_endpoints_router
+from src.endpoints.ops import router as ops_endpoints_router
 from src.endpoints.payments import router as payment_endpoints_router
 from src.endpoints.users import router as user_endpoints_router
+from src.endpoints.webhooks import router as webhook_endpoints_router
+from src.middleware import (
+    RateLimitMiddleware, LoadSheddingMiddleware, MetricsMiddleware, TimingMiddleware
+)
+from src.outbox import start_outboxes, stop_outboxes
+from src.search import word_index
+from src.upstream import start_upstreams, close_upstreams
+
+
+# Без обязательных переменных окружения приложение не стартует
+config.validate()
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """
+    Общие пулы соединений к апстримам и Redis живут столько же, сколько
+    приложение. К остановке сервер уже дождался запросов в обработке;
+    фоновым обновлениям кэша даём закончить, затем закрываем пулы.
+    """
+    await start_upstreams()
+    await invalidation_listener.start()
+    await word_index.start()
+    for bloom in bloom_filters:
+        await bloom.start()
+    await start_outboxes()
+    try:
+        yield
+    finally:
+        await stop_outboxes()
+        await word_index.stop()
+        for bloom in bloom_filters:
+            await bloom.stop()
+        await invalidation_listener.stop()
+        await drain_refreshes(timeout=config.flight_lock_ttl.total_seconds())
+        await close_upstreams()
+        await close_redis()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+# Порядок обратный: последний добавленный middleware — внешний.
+# Сброс нагрузки проверяется раньше обращения к Redis за лимитом,
+# метрики учитывают и отклонённые запросы, а CORS снаружи,
+# чтобы 429/503 тоже несли его заголовки.
+app.add_middleware(RateLimitMiddleware, settings=config.rate_limit, routes=app.router.routes) # noqa
+app.add_middleware(LoadSheddingMiddleware, settings=config.rate_limit) # noqa
+app.add_middleware(TimingMiddleware, settings=config.timing) # noqa
+app.add_middleware(MetricsMiddleware) # noqa
 app.add_middleware(
     CORSMiddleware, # noqa
     allow_origins=["*"],
@@ -19,6 +70,9 @@ app.add_middleware(
 app.include_router(user_endpoints_router)
 app.include_router(payment_endpoints_router)
 app.include_router(dictionary_endpoints_router)
+app.include_router(metrics_endpoints_router)
+app.include_router(ops_endpoints_router)
+app.include_router(webhook_endpoints_router)
 
 if __name__ == '__main__':
     uvicorn.run(
@@ -0,0 +1,84 @@
+__all__ = [
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'Registry',
+    'registry',
+    'http_latency',
+    'http_in_flight',
+    'cache_requests',
+    'upstream_latency',
+    'upstream_errors',
+    'redis_rtt',
+    'rate_limited',
+    'shed_requests',
+    'webhook_events',
+    'observe_redis',
+    'RequestTiming',
+    'bind_timing',
+    'unbind_timing',
+    'record_phase',
+    'note_cache',
+    'phase',
+]
+
+import time
+
+from .registry import Counter, Gauge, Histogram, Registry
+from .timing import RequestTiming, bind_timing, unbind_timing, record_phase, note_cache, phase
+
+registry = Registry()
+
+http_latency = registry.register(Histogram(
+    'gateway_http_request_duration_seconds',
+    'Время обработки запроса шлюзом',
+    labels=('route', 'method', 'status'),
+))
+http_in_flight = registry.register(Gauge(
+    'gateway_http_requests_in_flight',
+    'Запросы, обрабатываемые процессом прямо сейчас',
+))
+cache_requests = registry.register(Counter(
+    'gateway_cache_requests_total',
+    'Обращения к кэшу по пространствам имён: hit, stale, miss (fallback — часть промахов), bloom',
+    labels=('namespace', 'result'),
+))
+upstream_latency = registry.register(Histogram(
+    'gateway_upstream_request_duration_seconds',
+    'Время ответа апстрима (для потоковых ответов — до заголовков)',
+    labels=('upstream', 'method'),
+))
+upstream_errors = registry.register(Counter(
+    'gateway_upstream_errors_total',
+    'Неудачные вызовы апстрима: transport, 5xx, circuit_open',
+    labels=('upstream', 'kind'),
+))
+redis_rtt = registry.register(Histogram(
+    'gateway_redis_rtt_seconds',
+    'Время обращения к Redis по операциям',
+    labels=('op',),
+    buckets=(0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+))
+rate_limited = registry.register(Counter(
+    'gateway_rate_limited_total',
+    'Запросы, отклонённые лимитом частоты',
+    labels=('route',),
+))
+shed_requests = registry.register(Counter(
+    'gateway_shed_requests_total',
+    'Запросы, отклонённые сбросом нагрузки',
+))
+
+
+webhook_events = registry.register(Counter(
+    'gateway_webhook_events_total',
+    'Вызовы вебхуков: processed, duplicate, rejected, failed (кэш не сброшен)',
+    labels=('webhook', 'result'),
+))
+
+
+def observe_redis(op: str, started: float) -> None:
+    """ Время обращения к Redis: в гистограмму и в разбивку текущего запроса """
+    elapsed = time.perf_counter() - started
+    redis_rtt.observe(elapsed, op)
+    record_phase('redis', elapsed)
@@ -0,0 +1,165 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+Labels = Tuple[str, ...]
+
+# Границы корзин по умолчанию, в секундах
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """
+    Базовая метрика с набором меток. Значения меток передаются
+    позиционно в порядке `labels`. Блокировок нет: всё обновляется
+    из одного event loop, а операции над словарём атомарны под GIL.
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        ...
+
+
+class Counter(Metric):
+    """ Монотонно растущий счётчик """
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f'{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}'
+            for labels, value in list(self._values.items())
+        ]
+
+
+class Gauge(Metric):
+    """
+    Текущее значение. Вместо явных inc/dec можно передать `collect` —
+    функцию, которая возвращает {метки: значение} в момент выгрузки.
+    """
+
+    kind = 'gauge'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labels: Iterable[str] = (),
+            collect: Optional[Callable[[], Dict[Labels, float]]] = None
+    ):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Labels, float] = {}
+        self._collect = collect
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+    def set(self, value: float, *labels: str) -> None:
+        self._values[labels] = value
+
+    def samples(self) -> List[str]:
+        values = self._collect() if self._collect else self._values
+        return [
+            f'{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}'
+            for labels, value in list(values.items())
+        ]
+
+
+class Histogram(Metric):
+    """ Распределение значений по фиксированным корзинам """
+
+    kind = 'histogram'
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labels: Iterable[str] = (),
+            buckets: Iterable[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Для каждого набора меток: счётчики корзин (последняя — +Inf) и сумма
+        self._values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = state
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f'{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}'
+                )
+            suffix = _format_labels(self.labels, labels)
+            lines.append(f'{self.name}_sum{suffix} {_format_value(total[0])}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return lines
+
+
+class Registry:
+    """ Набор метрик процесса с выгрузкой в текстовом формате Prometheus """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f'Metric {metric.name} is already registered')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,96 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar, Token
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class RequestTiming:
+    """
+    Разбивка времени одного запроса по фазам (redis, upstream, json,
+    validation) и исходы обращений к кэшу. Живёт в contextvar, поэтому
+    доступна из любого кода, вызванного в рамках запроса. Время параллельных
+    вызовов суммируется, поэтому фазы могут в сумме превышать total.
+    """
+
+    __slots__ = ('started', 'phases', 'cache')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        # фаза -> [суммарное время, число замеров]
+        self.phases: Dict[str, List[float]] = {}
+        # "пространство:исход" -> число обращений
+        self.cache: Dict[str, int] = {}
+
+    def add(self, phase: str, elapsed: float) -> None:
+        state = self.phases.get(phase)
+        if state is None:
+            self.phases[phase] = [elapsed, 1]
+        else:
+            state[0] += elapsed
+            state[1] += 1
+
+    def note_cache(self, outcome: str) -> None:
+        self.cache[outcome] = self.cache.get(outcome, 0) + 1
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def header(self) -> str:
+        """ Значение заголовка Server-Timing (длительности в миллисекундах) """
+        parts = [
+            f'{phase};dur={total * 1000:.2f}' for phase, (total, _) in self.phases.items()
+        ]
+        if self.cache:
+            parts.append(f'cache;desc="{self._cache_summary()}"')
+        parts.append(f'total;dur={self.elapsed * 1000:.2f}')
+        return ', '.join(parts)
+
+    def _cache_summary(self) -> str:
+        if len(self.cache) == 1 and next(iter(self.cache.values())) == 1:
+            return next(iter(self.cache))
+        return ' '.join(f'{outcome}={count}' for outcome, count in self.cache.items())
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'duration_ms': round(self.elapsed * 1000, 2),
+            'phases': {
+                phase: {'ms': round(total * 1000, 2), 'count': int(count)}
+                for phase, (total, count) in self.phases.items()
+            },
+            'cache': dict(self.cache),
+        }
+
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar('request_timing', default=None)
+
+
+def bind_timing(timing: RequestTiming) -> Token:
+    return _current.set(timing)
+
+
+def unbind_timing(token: Token) -> None:
+    _current.reset(token)
+
+
+def record_phase(phase: str, elapsed: float) -> None:
+    """ Добавляет время фазы к текущему запросу (вне запроса — ничего не делает) """
+    timing = _current.get()
+    if timing is not None:
+        timing.add(phase, elapsed)
+
+
+def note_cache(namespace: str, result: str) -> None:
+    timing = _current.get()
+    if timing is not None:
+        timing.note_cache(f'{namespace}:{result}')
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """ Замеряет блок кода как фазу текущего запроса """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - started)
@@ -0,0 +1,11 @@
+__all__ = [
+    'RateLimitMiddleware',
+    'LoadSheddingMiddleware',
+    'MetricsMiddleware',
+    'TimingMiddleware',
+]
+
+from .ratelimit import RateLimitMiddleware
+from .metrics import MetricsMiddleware
+from .shedding import LoadSheddingMiddleware
+from .timing import TimingMiddleware
@@ -0,0 +1,43 @@
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.metrics import http_latency, http_in_flight
+
+
+class MetricsMiddleware:
+    """
+    Время обработки запросов по маршрутам и статусам и число запросов
+    в обработке. Маршрут берётся шаблоном из FastAPI, а не сырым путём,
+    чтобы число рядов метрики не зависело от входящих URL.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = '500'
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = str(message['status'])
+            await send(message)
+
+        started = time.perf_counter()
+        http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_in_flight.dec()
+            route = scope.get('route')
+            http_latency.observe(
+                time.perf_counter() - started,
+                route.path if route is not None else 'unmatched',
+                scope['method'],
+                status,
+            )
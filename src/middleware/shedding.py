@@ -0,0 +1,49 @@
+import logging
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.config import RateLimitConfig
+from src.metrics import shed_requests
+
+logger = logging.getLogger('gateway')
+
+
+class LoadSheddingMiddleware:
+    """
+    Общий предел одновременно обрабатываемых запросов процесса.
+    Сверх него запросы сразу получают 503 с Retry-After, не занимая
+    event loop и пулы соединений к апстримам. Запрос считается
+    обрабатываемым, пока не отдано всё тело ответа.
+    """
+
+    def __init__(self, app: ASGIApp, settings: RateLimitConfig):
+        self.app = app
+        self.settings = settings
+        self.in_flight = 0
+        self.shed = 0
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        limit = self.settings.max_in_flight
+        if scope['type'] != 'http' or not limit or scope['path'] in self.settings.exempt:
+            await self.app(scope, receive, send)
+            return
+
+        if self.in_flight >= limit:
+            self.shed += 1
+            shed_requests.inc()
+            if self.shed % 100 == 1:
+                logger.warning(f'Shedding load: {self.in_flight} requests in flight, {self.shed} shed so far')
+            response = JSONResponse(
+                {'detail': 'Service Unavailable'},
+                status_code=503,
+                headers={'Retry-After': str(self.settings.shed_retry_after)},
+            )
+            await response(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
@@ -0,0 +1,55 @@
+import logging
+from json import dumps
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.config import TimingConfig
+from src.metrics import RequestTiming, bind_timing, unbind_timing
+
+logger = logging.getLogger('gateway')
+
+
+class TimingMiddleware:
+    """
+    Собирает разбивку времени запроса по фазам и отдаёт её в заголовке
+    Server-Timing (на момент отправки заголовков). Запросы дольше порога
+    пишутся в журнал одной JSON-строкой вместе с исходами кэша.
+    """
+
+    def __init__(self, app: ASGIApp, settings: TimingConfig):
+        self.app = app
+        self.settings = settings
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                if self.settings.server_timing:
+                    MutableHeaders(scope=message).append('Server-Timing', timing.header())
+            await send(message)
+
+        token = bind_timing(timing)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            unbind_timing(token)
+            threshold = self.settings.slow_request_ms
+            if threshold and timing.elapsed * 1000 >= threshold:
+                route = scope.get('route')
+                logger.warning(dumps({
+                    'event': 'slow_request',
+                    'method': scope['method'],
+                    'path': scope['path'],
+                    'route': route.path if route is not None else None,
+                    'status': status,
+                    **timing.as_dict(),
+                }))
@@ -0,0 +1,13 @@
+from pydantic import BaseModel, model_validator
+
+from src.metrics import phase
+
+
+class TimedModel(BaseModel):
+    """ Модель, время валидации которой попадает в разбивку запроса (Server-Timing) """
+
+    @model_validator(mode='wrap')
+    @classmethod
+    def _timed_validation(cls, data, handler):
+        with phase('validation'):
+            return handler(data)
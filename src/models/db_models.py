@@ -2,9 +2,10 @@ from datetime import datetime, timedelta, date
 from enum import Enum
 from typing import List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import Field
 
 from src.config import config
+from .base import TimedModel
 
 
 class Language(str, Enum):
@@ -31,7 +32,7 @@ class Topic(str, Enum):
     GAMES = "games"
 
 
-class User(BaseModel):
+class User(TimedModel):
     """
     Модель нового пользователя (для базы данных).
     """
@@ -44,7 +45,7 @@ class User(BaseModel):
     topics: List[str]
     lang_code: str
 
-class Profile(BaseModel):
+class Profile(TimedModel):
     """
     Модель профиля пользователя (для базы данных)
     """
@@ -58,7 +59,7 @@ class Profile(BaseModel):
     status: Optional[str] = Field('rookie', description="Видимый статус пользователя")
 
 
-class Payment(BaseModel):
+class Payment(TimedModel):
     """
     Модель платежа (для базы данных).
     """
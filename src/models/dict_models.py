@@ -1,16 +1,20 @@
 from typing import Union, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import Field
 
+from .base import TimedModel
 
-class Word(BaseModel):
+
+class Word(TimedModel):
     user_id: int = Field(..., description="Уникальный идентификатор пользователя")
     word: Union[str, None] = Field(None, description="Слово, которое нужно добавить в словарь")
     part_of_speech: Union[str, None] = Field(None, description="Часть речи слова")
     translation: Union[str, None] = Field(None, description="Перевод слова")
     is_public: bool = Field(False, description="Видно ли слово остальным пользователям")
     context: Optional[str] = Field(None, description="Контекст к слову")
-    audio: Optional[bytes] = Field(None, description="bytes of audio recording")
+    audio: Optional[bytes] = Field(
+        None, description="bytes of audio recording (лучше загружать отдельно: PUT /api/words/audio)"
+    )
 
     source: Optional[str] = Field(
         default="api", description="Источник запроса (api, tg-bot-service, etc)"
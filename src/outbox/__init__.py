@@ -0,0 +1,30 @@
+__all__ = [
+    'Outbox',
+    'PermanentError',
+    'trial_payments',
+    'word_writes',
+    'apply_pending',
+    'apply_pending_stats',
+    'saved_word',
+    'sync_dictionary_cache',
+    'outboxes',
+    'create_trial_payment',
+    'start_outboxes',
+    'stop_outboxes',
+]
+
+from .payments import trial_payments, create_trial_payment
+from .stream import Outbox, PermanentError
+from .words import word_writes, apply_pending, apply_pending_stats, saved_word, sync_dictionary_cache
+
+outboxes = (trial_payments, word_writes)
+
+
+async def start_outboxes() -> None:
+    for outbox in outboxes:
+        await outbox.start()
+
+
+async def stop_outboxes() -> None:
+    for outbox in outboxes:
+        await outbox.stop()
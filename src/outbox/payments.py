@@ -0,0 +1,25 @@
+import logging
+from typing import Dict
+
+from src.config import config
+from src.upstream import payments
+from .stream import Outbox, check_response
+
+logger = logging.getLogger('gateway')
+
+
+async def create_trial_payment(fields: Dict[str, str]) -> None:
+    """ Создаёт пробный платёж в платёжном сервисе по записи outbox """
+    url = f"{config.payments.handler.prefix}/add"
+    response = await payments.post(
+        url=url,
+        headers={"Content-Type": "application/json"},
+        content=fields['payload'],
+    )
+    check_response(response, f"trial payment for user {fields['user_id']}")
+    logger.info(f"Trial payment created for user {fields['user_id']}: {response.status_code}")
+
+
+trial_payments = Outbox(
+    'trial_payments', create_trial_payment, key_field='user_id', settings=config.outbox
+)
@@ -0,0 +1,303 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from redis.exceptions import ResponseError
+
+from src.cache.client import redis, CACHE_ERRORS
+from src.config import OutboxConfig
+
+logger = logging.getLogger('gateway')
+
+Handler = Callable[[Dict[str, str]], Awaitable[None]]
+Entry = Tuple[bytes, Dict[bytes, bytes], int]
+
+
+def decode(raw: Dict[bytes, bytes]) -> Dict[str, str]:
+    return {k.decode(): v.decode() for k, v in raw.items()}
+
+
+class PermanentError(Exception):
+    """ Ошибка, которую бессмысленно повторять: запись сразу уходит в dead-letter """
+
+
+def check_response(response: httpx.Response, action: str) -> None:
+    """ Ошибочный ответ апстрима — в исключение: 4xx (кроме таймаута и лимита) повтор не исправит """
+    if response.status_code < 300:
+        return
+    error = f'{action}: upstream answered {response.status_code}: {response.text[:200]}'
+    if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+        raise PermanentError(error)
+    raise RuntimeError(error)
+
+
+@dataclass
+class OutboxStats:
+    """ Счётчики обработки записей outbox в этом процессе """
+    enqueued: int = 0
+    processed: int = 0
+    duplicates: int = 0
+    failures: int = 0
+    dead_lettered: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'duplicates': self.duplicates,
+            'failures': self.failures,
+            'dead_lettered': self.dead_lettered,
+        }
+
+
+class Outbox:
+    """
+    Надёжная очередь побочных действий на Redis Streams.
+
+    Запись добавляется в поток `outbox:{name}` и обрабатывается фоновыми
+    потребителями группы `gateway` (по одному на процесс). Повтор одного
+    и того же действия исключает ключ идемпотентности по полю `key_field`:
+    пока запись обрабатывается, он занят на `lease`, после успеха хранит
+    отметку `done`. Неудачные записи остаются неподтверждёнными и
+    забираются повторно с экспоненциальной задержкой; после `max_attempts`
+    попыток (или при PermanentError) они переносятся в `outbox:{name}:dead`.
+    """
+
+    GROUP = 'gateway'
+
+    def __init__(self, name: str, handler: Handler, key_field: str, settings: OutboxConfig):
+        self.name = name
+        self.handler = handler
+        self.key_field = key_field
+        self.settings = settings
+        self.stream = f'outbox:{name}'
+        self.dead_stream = f'outbox:{name}:dead'
+        self.consumer = f'{socket.gethostname()}:{os.getpid()}'
+        self.stats = OutboxStats()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._group_ready = False
+        self._last_retry_scan = 0.0
+
+    def idempotency_key(self, fields: Dict[str, str]) -> str:
+        return f'{self.stream}:key:{fields[self.key_field]}'
+
+    async def enqueue(self, **fields: str) -> bool:
+        """ Добавляет запись; False — если Redis недоступен и запись не сохранена """
+        try:
+            await redis.xadd(
+                self.stream, fields, maxlen=self.settings.stream_maxlen, approximate=True
+            )
+        except CACHE_ERRORS as e:
+            logger.warning(f'Outbox {self.name}: enqueue failed: {e}')
+            return False
+        self.stats.enqueued += 1
+        return True
+
+    async def start(self) -> None:
+        if self._task is None and self.settings.enabled:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """ Даёт дообработать текущую пачку, затем останавливает потребителя """
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        self._stopping = True
+        try:
+            await asyncio.wait_for(task, timeout=timeout)
+        except asyncio.TimeoutError:
+            # wait_for уже отменил задачу; неподтверждённые записи заберут позже
+            pass
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                handled = await self._poll()
+            except asyncio.CancelledError:
+                raise
+            except CACHE_ERRORS as e:
+                logger.warning(f'Outbox {self.name}: consumer error: {e}')
+                self._group_ready = False
+                handled = 0
+                await asyncio.sleep(self.settings.error_delay)
+            if not handled:
+                await asyncio.sleep(self.settings.poll_interval)
+
+    async def _poll(self) -> int:
+        await self._ensure_group()
+
+        # Явный BLOCK не используем: socket_timeout общего пула рассчитан на короткие команды
+        reply = await redis.xreadgroup(
+            self.GROUP, self.consumer, {self.stream: '>'}, count=self.settings.batch_size
+        )
+        batch: List[Entry] = [
+            (entry_id, fields, 1) for _, entries in reply or () for entry_id, fields in entries
+        ]
+
+        now = time.monotonic()
+        if now - self._last_retry_scan >= self.settings.retry_scan_interval:
+            self._last_retry_scan = now
+            batch.extend(await self._claim_due())
+
+        if batch:
+            await self._handle(batch)
+        return len(batch)
+
+    async def _handle(self, batch: List[Entry]) -> None:
+        """ Обрабатывает пачку записей; по умолчанию — каждую отдельно """
+        semaphore = asyncio.Semaphore(self.settings.concurrency)
+
+        async def process(entry):
+            async with semaphore:
+                await self._process(*entry)
+
+        await asyncio.gather(*(process(entry) for entry in batch))
+
+    async def _ensure_group(self) -> None:
+        if self._group_ready:
+            return
+        try:
+            await redis.xgroup_create(self.stream, self.GROUP, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_ready = True
+
+    def backoff_ms(self, attempts: int) -> int:
+        """ Сколько запись должна пролежать неподтверждённой перед попыткой номер attempts + 1 """
+        delay = self.settings.backoff_base * 2 ** (attempts - 1)
+        return int(min(delay, self.settings.backoff_cap) * 1000)
+
+    async def _claim_due(self) -> List[Entry]:
+        """ Забирает неподтверждённые записи (в том числе упавших процессов), чья пауза истекла """
+        pending = await redis.xpending_range(
+            self.stream, self.GROUP, min='-', max='+', count=self.settings.batch_size,
+            idle=self.backoff_ms(1),
+        )
+        due = [
+            entry for entry in pending
+            if entry['time_since_delivered'] >= self.backoff_ms(entry['times_delivered'])
+        ]
+        claimed = []
+        for entry in due:
+            attempts = entry['times_delivered'] + 1
+            # Повторная проверка простоя внутри XCLAIM не даёт двум процессам забрать запись дважды
+            reply = await redis.xclaim(
+                self.stream, self.GROUP, self.consumer,
+                min_idle_time=self.backoff_ms(entry['times_delivered']),
+                message_ids=[entry['message_id']],
+            )
+            claimed.extend(
+                (entry_id, fields, attempts) for entry_id, fields in reply if fields
+            )
+        return claimed
+
+    async def _lease(self, fields: Dict[str, str]) -> str:
+        """
+        Занимает ключ идемпотентности записи на `lease`: 'leased' — можно
+        выполнять, 'done' — действие уже выполнено, 'busy' — запись сейчас
+        обрабатывает другой потребитель (например, забравший её по XCLAIM).
+        """
+        key = self.idempotency_key(fields)
+        if await redis.set(key, 'processing', nx=True, px=int(self.settings.lease * 1000)):
+            return 'leased'
+        return 'done' if await redis.get(key) == b'done' else 'busy'
+
+    async def _release(self, fields: Dict[str, str]) -> None:
+        await redis.delete(self.idempotency_key(fields))
+
+    async def _process(self, entry_id: bytes, raw: Dict[bytes, bytes], attempts: int) -> None:
+        fields = decode(raw)
+        key = self.idempotency_key(fields)
+
+        state = await self._lease(fields)
+        if state == 'done':
+            self.stats.duplicates += 1
+            await redis.xack(self.stream, self.GROUP, entry_id)
+        if state != 'leased':
+            # Занятую запись повторим позже
+            return
+
+        try:
+            await self.handler(fields)
+        except Exception as e:
+            await self._release(fields)
+            await self._failed(entry_id, fields, attempts, e)
+            return
+
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.set(key, 'done', ex=self.settings.done_ttl)
+            pipe.xack(self.stream, self.GROUP, entry_id)
+            await pipe.execute()
+        self.stats.processed += 1
+
+    async def _failed(
+            self,
+            entry_id: bytes,
+            fields: Dict[str, str],
+            attempts: int,
+            error: Exception
+    ) -> bool:
+        """
+        Оставляет запись для повтора или, если попытки кончились, переносит
+        в dead-letter. Возвращает True, если запись ещё будет повторена.
+        """
+        self.stats.failures += 1
+        if isinstance(error, PermanentError) or attempts >= self.settings.max_attempts:
+            await self._dead_letter(entry_id, fields, attempts, error)
+            return False
+        logger.warning(
+            f'Outbox {self.name}: attempt {attempts} for {fields.get(self.key_field)} failed, '
+            f'retrying in {self.backoff_ms(attempts) / 1000:.1f}s: {error!r}'
+        )
+        return True
+
+    async def _dead_letter(
+            self,
+            entry_id: bytes,
+            fields: Dict[str, str],
+            attempts: int,
+            error: Exception
+    ) -> None:
+        logger.error(
+            f'Outbox {self.name}: {fields.get(self.key_field)} moved to {self.dead_stream} '
+            f'after {attempts} attempts: {error!r}'
+        )
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(
+                self.dead_stream,
+                {**fields, 'error': repr(error), 'attempts': str(attempts), 'entry_id': entry_id},
+                maxlen=self.settings.stream_maxlen,
+                approximate=True,
+            )
+            pipe.xack(self.stream, self.GROUP, entry_id)
+            await pipe.execute()
+        self.stats.dead_lettered += 1
+
+    async def snapshot(self) -> Dict[str, object]:
+        """ Длины потоков и число неподтверждённых записей (для служебного маршрута) """
+        snapshot: Dict[str, object] = {'consumer': self.consumer, **self.stats.as_dict()}
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                pipe.xlen(self.stream)
+                pipe.xlen(self.dead_stream)
+                stream_len, dead_len = await pipe.execute()
+            pending = await redis.xpending(self.stream, self.GROUP) if self._group_ready else None
+        except CACHE_ERRORS as e:
+            snapshot['error'] = str(e)
+            return snapshot
+        snapshot.update(
+            stream_length=stream_len,
+            dead_letters=dead_len,
+            pending=pending['pending'] if pending else 0,
+        )
+        return snapshot
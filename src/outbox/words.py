@@ -0,0 +1,313 @@
+import asyncio
+import logging
+import time
+from json import dumps, loads
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import httpx
+
+from src.cache import invalidate, is_empty, patch_word
+from src.cache.client import redis, CACHE_ERRORS
+from src.cache.patch import patch_stats
+from src.config import config, OutboxConfig, WriteBehindConfig, WriteThroughConfig
+from src.search import word_index
+from src.upstream import database
+from .stream import Entry, Outbox, check_response, decode
+
+logger = logging.getLogger('gateway')
+
+# Запись потока, уже разобранная: id, поля, номер попытки
+Op = Tuple[bytes, Dict[str, str], int]
+
+
+def saved_word(resp: httpx.Response, word: Dict[str, Any]) -> Optional[Tuple[int, Dict[str, Any]]]:
+    """ id и поля только что сохранённого слова, если database-сервис вернул его word_id """
+    try:
+        data = resp.json()
+        if not isinstance(data, dict) or data.get('word_id') is None:
+            return None
+        return int(data['word_id']), {**word, **data}
+    except (ValueError, TypeError):
+        return None
+
+
+async def sync_dictionary_cache(
+        user_id: int,
+        op: str,
+        word_id: Optional[int] = None,
+        word: Optional[Dict[str, Any]] = None
+) -> None:
+    """
+    После записи слова правит кэш словаря на месте (а если нельзя — сбрасывает
+    его) и сообщает об изменении индексу публичных слов. Публичное слово
+    без id индекс не вставит — он перезагрузится из database-сервиса.
+    """
+    if word_id is not None:
+        await word_index.publish({'op': op, 'word_id': word_id, 'word': word})
+    elif op == 'save' and (word or {}).get('is_public'):
+        await word_index.publish({'op': 'reload'})
+    if config.write_through.enabled and word_id is not None:
+        if await patch_word(user_id, op, word_id, config.write_through, word):
+            return
+    await invalidate(tags=[f'dictionary:{user_id}'])
+
+
+def word_change(fields: Dict[str, str], resp: Optional[httpx.Response] = None) -> tuple:
+    """ Аргументы sync_dictionary_cache для выполненной отложенной операции """
+    if fields['op'] == 'delete':
+        return 'delete', int(fields['word_id'])
+    word = loads(fields['payload'])
+    # Аудио в кэш словаря и индекс не попадает, как и при синхронной записи
+    word.pop('audio', None)
+    return 'save', *((resp is not None and saved_word(resp, word)) or (None, word))
+
+
+async def write_word(fields: Dict[str, str]) -> httpx.Response:
+    """ Применяет к database-сервису одну отложенную операцию со словом """
+    if fields['op'] == 'save':
+        response = await database.post(
+            url=config.database.prefix + '/words',
+            headers={'content-type': 'application/json'},
+            content=fields['payload'],
+        )
+    else:
+        response = await database.delete(
+            url=config.database.prefix
+            + f"/words?user_id={fields['user_id']}&word_id={fields['word_id']}"
+        )
+    check_response(response, f"{fields['op']} word for user {fields['user_id']}")
+    return response
+
+
+async def write_words_bulk(user_id: str, ops: List[Dict[str, str]]) -> None:
+    """ Все накопившиеся операции пользователя одним запросом к database-сервису """
+    body = {
+        'user_id': int(user_id),
+        'ops': [
+            {'op': 'save', 'word': loads(op['payload'])} if op['op'] == 'save'
+            else {'op': 'delete', 'word_id': int(op['word_id'])}
+            for op in ops
+        ],
+    }
+    response = await database.post(
+        url=config.database.prefix + config.database.bulk_words_path, json=body
+    )
+    check_response(response, f'{len(ops)} word writes for user {user_id}')
+
+
+def apply_pending(body: bytes, ops: List[Dict[str, str]]) -> bytes:
+    """
+    Накладывает ещё не записанные операции пользователя на тело ответа
+    /words. Словарь приходит либо объектом {word_id: слово}, либо списком
+    слов с полем word_id; у несохранённого слова id ещё нет, поэтому
+    оно получает временный ключ `pending:{op_id}` и отметку pending.
+    """
+    data = loads(body) if body and not is_empty(body) else None
+    if data is None:
+        data = {}
+    for op in ops:
+        if op['op'] == 'save':
+            word = {**loads(op['payload']), 'pending': True}
+            if isinstance(data, dict):
+                data[f"pending:{op['op_id']}"] = word
+            else:
+                data.append(word)
+        elif isinstance(data, dict):
+            data.pop(op['word_id'], None)
+        else:
+            data = [
+                word for word in data
+                if str(word.get('word_id', word.get('id'))) != op['word_id']
+            ]
+    return dumps(data, ensure_ascii=False).encode()
+
+
+def apply_pending_stats(body: bytes, ops: List[Dict[str, str]], settings: WriteThroughConfig) -> bytes:
+    """
+    Накладывает незаписанные операции на счётчики /words/stats (поля из
+    WriteThroughConfig). Удаляемое слово считается публичным, если оно есть
+    в индексе публичных слов; пока индекс не загружен, публичный счётчик
+    при удалении не меняется. Неразборчивое тело отдаётся как есть.
+    """
+    patched = body
+    for op in ops:
+        if op['op'] == 'save':
+            old, new = None, loads(op['payload'])
+        else:
+            old, new = {'is_public': int(op['word_id']) in word_index}, None
+        patched = patch_stats(patched, old, new, settings)
+        if patched is None:
+            return body
+    return patched
+
+
+class WordWriteBehind(Outbox):
+    """
+    Отложенная запись слов словаря (write-behind).
+
+    Операция сохраняется в поток `outbox:word_writes` и одновременно в хэш
+    `pending_words:{user_id}`, по которому чтения словаря видят свои ещё
+    не записанные изменения. Потребитель группирует пачку по пользователям
+    и применяет операции каждого по порядку — одним пакетным запросом,
+    если у database-сервиса есть DATABASE_BULK_WORDS_PATH, иначе по одной.
+    Каждая операция перед отправкой занимает ключ идемпотентности по op_id,
+    как и в Outbox._process, поэтому запись, забранная другим воркером по
+    XCLAIM во время отправки, повторно не выполняется. Пока в `pending_words`
+    есть более ранняя операция пользователя (ждёт повтора или выполняется
+    другим потребителем), его новые операции откладываются. Выполненные
+    операции проходят через sync_dictionary_cache, как и синхронные
+    записи: кэш словаря правится или сбрасывается, индекс публичных слов
+    получает события. Затем операции убираются из `pending_words`.
+    """
+
+    def __init__(self, settings: OutboxConfig, write_behind: WriteBehindConfig):
+        super().__init__('word_writes', write_word, key_field='op_id', settings=settings)
+        self.write_behind = write_behind
+
+    @staticmethod
+    def pending_key(user_id) -> str:
+        return f'pending_words:{user_id}'
+
+    async def submit(self, user_id: int, op: str, **data: str) -> Optional[str]:
+        """ Ставит операцию в очередь; None — если Redis недоступен и писать надо сразу """
+        op_id = uuid4().hex
+        record = {'op_id': op_id, 'op': op, 'user_id': str(user_id), 'at': str(time.time_ns()), **data}
+        key = self.pending_key(user_id)
+        try:
+            async with redis.pipeline(transaction=True) as pipe:
+                pipe.hset(key, op_id, dumps(record))
+                pipe.expire(key, self.write_behind.pending_ttl)
+                pipe.xadd(
+                    self.stream, record, maxlen=self.settings.stream_maxlen, approximate=True
+                )
+                await pipe.execute()
+        except CACHE_ERRORS as e:
+            logger.warning(f'Outbox {self.name}: enqueue failed: {e}')
+            return None
+        self.stats.enqueued += 1
+        return op_id
+
+    async def pending(self, user_id: int) -> List[Dict[str, str]]:
+        """ Незаписанные операции пользователя в порядке поступления (при сбое Redis — пусто) """
+        try:
+            values = await redis.hvals(self.pending_key(user_id))
+        except CACHE_ERRORS as e:
+            logger.warning(f'Outbox {self.name}: pending read failed: {e}')
+            return []
+        return sorted((loads(value) for value in values), key=lambda op: int(op['at']))
+
+    async def pending_many(self, user_ids: List[int]) -> Dict[int, List[Dict[str, str]]]:
+        """ То же для нескольких пользователей за один проход; без операций пользователи не попадают """
+        try:
+            async with redis.pipeline(transaction=False) as pipe:
+                for user_id in user_ids:
+                    pipe.hvals(self.pending_key(user_id))
+                replies = await pipe.execute()
+        except CACHE_ERRORS as e:
+            logger.warning(f'Outbox {self.name}: pending read failed: {e}')
+            return {}
+        return {
+            user_id: sorted((loads(value) for value in values), key=lambda op: int(op['at']))
+            for user_id, values in zip(user_ids, replies) if values
+        }
+
+    async def _handle(self, batch: List[Entry]) -> None:
+        by_user: Dict[str, List[Entry]] = {}
+        for entry in batch:
+            by_user.setdefault(entry[1][b'user_id'].decode(), []).append(entry)
+
+        semaphore = asyncio.Semaphore(self.settings.concurrency)
+
+        async def flush(user_id, entries):
+            async with semaphore:
+                await self._flush(user_id, entries)
+
+        await asyncio.gather(*(flush(user_id, entries) for user_id, entries in by_user.items()))
+
+    async def _blocked(self, user_id: str, ops: List[Op]) -> bool:
+        """ У пользователя есть более ранняя операция не из этой пачки: она ждёт повтора или уже выполняется """
+        first = int(ops[0][1]['at'])
+        batch = {fields['op_id'] for _, fields, _ in ops}
+        return any(
+            int(op['at']) < first and op['op_id'] not in batch
+            for op in await self.pending(int(user_id))
+        )
+
+    async def _flush(self, user_id: str, entries: List[Entry]) -> None:
+        # Порядок операций пользователя — по времени постановки в очередь
+        ops = sorted(
+            ((entry_id, decode(raw), attempts) for entry_id, raw, attempts in entries),
+            key=lambda op: int(op[1]['at']),
+        )
+        if await self._blocked(user_id, ops):
+            # Записи остаются неподтверждёнными и вернутся через _claim_due
+            return
+
+        leased: List[Op] = []
+        for op in ops:
+            state = await self._lease(op[1])
+            if state == 'done':
+                self.stats.duplicates += 1
+                await self._complete(user_id, [op], mark=False)
+                continue
+            if state == 'busy':
+                # Операцию выполняет другой потребитель — следующие не должны её обогнать
+                break
+            leased.append(op)
+
+        done: List[Op] = []
+        # Ответы на одиночные записи: из них берутся id сохранённых слов
+        responses: List[Optional[httpx.Response]] = []
+        if leased and config.database.bulk_words_path:
+            try:
+                await write_words_bulk(user_id, [fields for _, fields, _ in leased])
+                done = leased
+                responses = [None] * len(done)
+            except Exception as e:
+                for op in leased:
+                    await self._release(op[1])
+                    await self._failed(*op, e)
+        else:
+            for i, op in enumerate(leased):
+                try:
+                    response = await self.handler(op[1])
+                except Exception as e:
+                    await self._release(op[1])
+                    if await self._failed(*op, e):
+                        # Следующие операции пользователя не обгоняют ту, что ещё будет повторена
+                        for rest in leased[i + 1:]:
+                            await self._release(rest[1])
+                        break
+                    continue
+                done.append(op)
+                responses.append(response)
+
+        if done:
+            for (_, fields, _), response in zip(done, responses):
+                await sync_dictionary_cache(int(user_id), *word_change(fields, response))
+            await self._complete(user_id, done)
+            self.stats.processed += len(done)
+
+    async def _complete(self, user_id: str, ops: List[Op], mark: bool = True) -> None:
+        """ Отмечает операции выполненными, подтверждает записи и убирает их из pending_words """
+        async with redis.pipeline(transaction=True) as pipe:
+            if mark:
+                for _, fields, _ in ops:
+                    pipe.set(self.idempotency_key(fields), 'done', ex=self.settings.done_ttl)
+            pipe.xack(self.stream, self.GROUP, *(entry_id for entry_id, _, _ in ops))
+            pipe.hdel(self.pending_key(user_id), *(fields['op_id'] for _, fields, _ in ops))
+            await pipe.execute()
+
+    async def _dead_letter(
+            self,
+            entry_id: bytes,
+            fields: Dict[str, str],
+            attempts: int,
+            error: Exception
+    ) -> None:
+        await super()._dead_letter(entry_id, fields, attempts, error)
+        await redis.hdel(self.pending_key(fields['user_id']), fields['op_id'])
+
+
+word_writes = WordWriteBehind(config.outbox, config.write_behind)
@@ -0,0 +1,6 @@
+__all__ = [
+    'WordIndex',
+    'word_index',
+]
+
+from .words import WordIndex, word_index
@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left, insort
+from json import dumps, loads
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from src.cache import redis
+from src.cache.client import CACHE_ERRORS
+from src.config import config, WordIndexConfig
+from src.upstream import database
+
+logger = logging.getLogger('gateway')
+
+CHANNEL = 'gateway:words'
+
+
+def normalize(word: str) -> str:
+    return word.strip().casefold()
+
+
+def owner_of(word: Dict[str, Any]) -> Optional[int]:
+    return int(word['user_id']) if word.get('user_id') is not None else None
+
+
+class WordIndex:
+    """
+    Индекс публичных слов всех пользователей в памяти процесса.
+
+    Слова лежат в отсортированном списке ключей `нормализованное слово\\0word_id`,
+    так что точный и префиксный поиск — это bisect и короткий проход вперёд.
+    Каждое слово хранится уже сериализованным фрагментом `"word_id": {...}`
+    со всеми полями: ответ склеивается из готовых кусков без разбора и имеет
+    ту же форму {word_id: слово}, что и ответ database-сервиса. Индекс
+    загружается целиком на старте (DATABASE_PUBLIC_WORDS_PATH) и раз
+    в `reload_interval` — разбор и сортировка идут в отдельном потоке, — а
+    между загрузками обновляется событиями сохранения и удаления слов из
+    канала `gateway:words`. Событие `reload` (сохранено публичное слово,
+    id которого апстрим не вернул) переносит ближайшую загрузку на
+    `stale_delay` секунд вперёд. Пока первая загрузка не прошла, поиск идёт
+    в database-сервис, как раньше.
+    """
+
+    def __init__(self, settings: WordIndexConfig, channel: str = CHANNEL):
+        self.settings = settings
+        self.channel = channel
+        self.ready = False
+        self.loaded_at: Optional[float] = None
+        self._keys: List[str] = []
+        self._entries: Dict[int, bytes] = {}
+        self._key_of: Dict[int, str] = {}
+        self._owner: Dict[int, int] = {}
+        self._spelling: Dict[int, str] = {}
+        # События, пришедшие во время фоновой загрузки: применяются поверх неё
+        self._missed: Optional[List[Dict[str, Any]]] = None
+        self._reload_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, word_id: int) -> bool:
+        return int(word_id) in self._entries
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled and bool(config.database.public_words_path)
+
+    # --- поиск ---
+
+    def _scan(self, start: str, prefix: str) -> Iterator[str]:
+        for i in range(bisect_left(self._keys, start), len(self._keys)):
+            key = self._keys[i]
+            if not key.startswith(prefix):
+                return
+            yield key
+
+    def _matches(self, word: str, prefix: bool, exclude_user: Optional[int]) -> Iterator[bytes]:
+        norm = normalize(word)
+        bound = norm if prefix else norm + '\0'
+        for key in self._scan(bound, bound):
+            word_id = int(key.rpartition('\0')[2])
+            if exclude_user is not None and self._owner[word_id] == exclude_user:
+                continue
+            yield self._entries[word_id]
+
+    def search(self, word: str, prefix: bool = False, exclude_user: Optional[int] = None) -> bytes:
+        """
+        Публичные слова, совпадающие с `word` (или начинающиеся с него) без
+        учёта регистра. Как и database-сервис, поиск от имени пользователя
+        не возвращает его собственные слова. Не больше `max_results`.
+        """
+        found = []
+        for entry in self._matches(word, prefix, exclude_user):
+            found.append(entry)
+            if len(found) >= self.settings.max_results:
+                break
+        return b'{' + b','.join(found) + b'}'
+
+    def complete(self, prefix: str, limit: int) -> List[str]:
+        """
+        Различные слова, начинающиеся с `prefix` без учёта регистра, по
+        алфавиту. Из слов, различающихся только регистром, возвращается
+        написание с наименьшим word_id.
+        """
+        norm = normalize(prefix)
+        words: List[str] = []
+        last = None
+        for key in self._scan(norm, norm):
+            word, _, word_id = key.rpartition('\0')
+            if word != last:
+                words.append(self._spelling[int(word_id)])
+                last = word
+                if len(words) >= limit:
+                    break
+        return words
+
+    # --- изменения ---
+
+    @staticmethod
+    def _entry(word: Dict[str, Any]) -> Optional[Tuple[int, bytes, str]]:
+        """ word_id, фрагмент ответа `"word_id": {...}` и ключ сортировки """
+        if word.get('word_id') is None or not word.get('word'):
+            return None
+        word_id = int(word['word_id'])
+        entry = dumps({str(word_id): word}, ensure_ascii=False)[1:-1].encode()
+        return word_id, entry, f"{normalize(word['word'])}\0{word_id}"
+
+    def upsert(self, word: Dict[str, Any]) -> None:
+        """ Добавляет или заменяет слово; непубличное слово из индекса убирается """
+        word_id = word.get('word_id')
+        if word_id is None:
+            return
+        self.remove(int(word_id))
+        parsed = self._entry(word) if word.get('is_public', True) else None
+        if parsed is None:
+            return
+        word_id, entry, key = parsed
+        insort(self._keys, key)
+        self._entries[word_id] = entry
+        self._key_of[word_id] = key
+        self._owner[word_id] = owner_of(word)
+        self._spelling[word_id] = word['word']
+
+    def remove(self, word_id: int) -> None:
+        key = self._key_of.pop(int(word_id), None)
+        if key is None:
+            return
+        del self._entries[int(word_id)]
+        del self._owner[int(word_id)]
+        del self._spelling[int(word_id)]
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+    def apply(self, event: Dict[str, Any]) -> None:
+        if self._missed is not None:
+            self._missed.append(event)
+        if event.get('op') == 'save':
+            self.upsert(event.get('word') or {})
+        elif event.get('op') == 'delete':
+            self.remove(event['word_id'])
+        elif event.get('op') == 'reload':
+            self._reload_at = min(self._reload_at, time.monotonic() + self.settings.stale_delay)
+
+    @classmethod
+    def build(cls, words: List[Dict[str, Any]]) -> tuple:
+        """ Содержимое индекса из полного списка слов; не трогает текущее состояние """
+        entries, key_of, owner, spelling = {}, {}, {}, {}
+        for word in words:
+            if not word.get('is_public', True):
+                continue
+            parsed = cls._entry(word)
+            if parsed is None:
+                continue
+            word_id, entry, key = parsed
+            entries[word_id], key_of[word_id] = entry, key
+            owner[word_id] = owner_of(word)
+            spelling[word_id] = word['word']
+        return sorted(key_of.values()), entries, key_of, owner, spelling
+
+    def install(self, state: tuple) -> None:
+        self._keys, self._entries, self._key_of, self._owner, self._spelling = state
+        self.ready = True
+        self.loaded_at = time.time()
+
+    def replace(self, words: List[Dict[str, Any]]) -> None:
+        """ Полная замена содержимого (загрузка из database-сервиса) """
+        self.install(self.build(words))
+
+    @classmethod
+    def parse(cls, content: bytes) -> tuple:
+        data = loads(content)
+        return cls.build(list(data.values()) if isinstance(data, dict) else data)
+
+    async def publish(self, event: Dict[str, Any]) -> None:
+        """ Применяет событие к своему индексу и рассылает его остальным репликам """
+        if not self.enabled:
+            return
+        self.apply(event)
+        try:
+            await redis.publish(self.channel, dumps(event, ensure_ascii=False))
+        except CACHE_ERRORS as e:
+            logger.warning(f'Word index event broadcast failed: {e}')
+
+    # --- загрузка и подписка ---
+
+    async def load(self) -> None:
+        resp = await database.get(url=config.database.prefix + config.database.public_words_path)
+        if resp.status_code != 200:
+            raise RuntimeError(f'public words: upstream answered {resp.status_code}')
+        # Разбор и сортировка всех публичных слов — не в цикле событий
+        self._reload_at = time.monotonic() + self.settings.reload_interval
+        self._missed = []
+        try:
+            state = await asyncio.to_thread(self.parse, resp.content)
+            missed = self._missed
+        finally:
+            self._missed = None
+        self.install(state)
+        for event in missed:
+            self.apply(event)
+        logger.info(f'Word index loaded: {len(self)} public words')
+
+    async def start(self) -> None:
+        if self._task is None and self.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        task, self._task = self._task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f'Word index sync failed: {e}')
+            await asyncio.sleep(self.settings.retry_delay)
+
+    async def _listen(self) -> None:
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(self.channel)
+            # Загрузка после подписки: события, пришедшие во время неё, не теряются
+            await self.load()
+            while True:
+                if time.monotonic() >= self._reload_at:
+                    await self.load()
+                message = await pubsub.get_message(timeout=1.0)
+                if message is None or message.get('type') != 'message':
+                    continue
+                try:
+                    self.apply(loads(message['data']))
+                except (ValueError, KeyError, TypeError):
+                    logger.warning(f'Malformed word index event: {message["data"]!r}')
+        finally:
+            await pubsub.aclose()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'enabled': self.enabled, 'ready': self.ready, 'words': len(self), 'loaded_at': self.loaded_at}
+
+
+word_index = WordIndex(config.word_index)
@@ -0,0 +1,59 @@
+"""
+Точка входа для продакшена: python -m src.server
+
+Несколько воркеров uvicorn, uvloop и httptools, если они установлены,
+настроенные backlog и keep-alive. По SIGTERM сервер перестаёт принимать
+соединения, ждёт завершения запросов в обработке (не дольше
+SERVER_GRACEFUL_TIMEOUT) и закрывает пулы в lifespan приложения.
+
+Воркеры — отдельные процессы со своим состоянием: /metrics, /api/breakers,
+/api/cache/stats, /api/upstreams и предел MAX_IN_FLIGHT относятся к тому
+воркеру, который ответил на запрос. Если нужна точная картина по процессу,
+запускайте WORKERS=1 и масштабируйте число контейнеров.
+"""
+import logging
+import sys
+from importlib.util import find_spec
+
+import uvicorn
+
+from src.config import config, ConfigError
+
+logger = logging.getLogger('gateway')
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    try:
+        config.validate()
+    except ConfigError as e:
+        logger.critical(str(e))
+        sys.exit(2)
+
+    settings = config.server
+    loop = 'uvloop' if find_spec('uvloop') else 'asyncio'
+    http = 'httptools' if find_spec('httptools') else 'h11'
+    logger.info(
+        f'Starting gateway on {config.host}:{config.port}: '
+        f'{settings.worker_count} workers, loop={loop}, http={http}'
+    )
+
+    uvicorn.run(
+        'src.main:app',
+        host=config.host,
+        port=config.port,
+        workers=settings.worker_count,
+        loop=loop,
+        http=http,
+        backlog=settings.backlog,
+        timeout_keep_alive=settings.keep_alive,
+        timeout_graceful_shutdown=settings.graceful_timeout,
+        limit_max_requests=settings.max_requests or None,
+        access_log=settings.access_log,
+        proxy_headers=settings.proxy_headers,
+        forwarded_allow_ips=settings.forwarded_allow_ips,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+__all__ = [
+    'Upstream',
+    'PoolStats',
+    'CircuitBreaker',
+    'CircuitOpenError',
+    'is_unavailable',
+    'Hedger',
+    'database',
+    'payments',
+    'upstreams',
+    'start_upstreams',
+    'close_upstreams',
+]
+
+from src.config import config
+from .breaker import CircuitBreaker, CircuitOpenError, is_unavailable
+from .client import Upstream, PoolStats
+from .hedging import Hedger
+
+database = Upstream(
+    'database',
+    f"http://{config.database.host}:{config.database.port}",
+    config.database.http,
+    config.database.breaker,
+    config.database.hedging,
+)
+payments = Upstream(
+    'payments',
+    f"http://{config.payments.host}:{config.payments.port}",
+    config.payments.http,
+    config.payments.breaker,
+    config.payments.hedging,
+)
+
+upstreams = (database, payments)
+
+
+async def start_upstreams() -> None:
+    for upstream in upstreams:
+        await upstream.start()
+
+
+async def close_upstreams() -> None:
+    for upstream in upstreams:
+        await upstream.close()
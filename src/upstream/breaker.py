@@ -0,0 +1,160 @@
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from src.config import BreakerConfig
+
+logger = logging.getLogger('gateway')
+
+
+class CircuitOpenError(Exception):
+    """ Апстрим помечен недоступным — запрос отклонён без обращения к нему """
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f'Upstream {name} is unavailable (circuit open)')
+        self.name = name
+        self.retry_after = retry_after
+
+    def as_http(self) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail=str(self),
+            headers={'Retry-After': str(max(math.ceil(self.retry_after), 1))},
+        )
+
+
+def is_unavailable(exc: BaseException) -> bool:
+    """ Апстрим не ответил по существу: цепь разомкнута, ошибка сети или 5xx """
+    if isinstance(exc, (CircuitOpenError, httpx.TransportError)):
+        return True
+    return isinstance(exc, HTTPException) and exc.status_code >= 500
+
+
+class CircuitBreaker:
+    """
+    Автомат closed → open → half-open для одного апстрима.
+
+    В закрытом состоянии считает долю неудачных вызовов (ошибки сети,
+    ответы 5xx и вызовы медленнее `slow_call_seconds`) в скользящем окне.
+    Превышение порога открывает цепь: вызовы сразу отклоняются
+    `CircuitOpenError`. Через `open_seconds` пропускается несколько
+    пробных вызовов; если все успешны, цепь снова замыкается.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, settings: BreakerConfig):
+        self.name = name
+        self.settings = settings
+        self.state = self.CLOSED
+        self.opened_count = 0
+        self.rejected = 0
+        self._calls: deque[tuple[float, bool, bool]] = deque()
+        self._failures = 0
+        self._slow = 0
+        self._bad = 0
+        self._opened_at = 0.0
+        self._trials = 0
+        self._trial_successes = 0
+
+    def before_call(self) -> None:
+        """ Пропускает вызов или отклоняет его, если цепь разомкнута """
+        if not self.settings.enabled:
+            return
+
+        if self.state == self.OPEN:
+            elapsed = time.monotonic() - self._opened_at
+            if elapsed < self.settings.open_seconds:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.settings.open_seconds - elapsed)
+            self._transition(self.HALF_OPEN)
+
+        if self.state == self.HALF_OPEN:
+            if self._trials >= self.settings.half_open_calls:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.settings.open_seconds)
+            self._trials += 1
+
+    def record(self, ok: Optional[bool], latency: float) -> None:
+        """
+        Учитывает завершённый вызов. `ok=None` — вызов прерван без ответа
+        (например, отменён клиентом): он лишь освобождает пробный слот.
+        """
+        if not self.settings.enabled:
+            return
+
+        if self.state == self.HALF_OPEN:
+            self._trials = max(self._trials - 1, 0)
+            if ok is None:
+                return
+            if not ok or latency >= self.settings.slow_call_seconds:
+                self._transition(self.OPEN)
+                return
+            self._trial_successes += 1
+            if self._trial_successes >= self.settings.half_open_calls:
+                self._transition(self.CLOSED)
+            return
+
+        if self.state == self.OPEN or ok is None:
+            # Поздние ответы на вызовы, начатые до размыкания, не учитываем
+            return
+
+        now = time.monotonic()
+        failed = not ok
+        slow = latency >= self.settings.slow_call_seconds
+        self._calls.append((now, failed, slow))
+        self._failures += failed
+        self._slow += slow
+        self._bad += failed or slow
+        self._prune(now)
+
+        calls = len(self._calls)
+        if calls >= self.settings.min_calls and self._bad / calls >= self.settings.failure_rate:
+            self._transition(self.OPEN)
+
+    def _prune(self, now: float) -> None:
+        horizon = now - self.settings.window_seconds
+        while self._calls and self._calls[0][0] < horizon:
+            _, failed, slow = self._calls.popleft()
+            self._failures -= failed
+            self._slow -= slow
+            self._bad -= failed or slow
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning(f'Circuit breaker for {self.name}: {self.state} -> {state}')
+        self.state = state
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+            self.opened_count += 1
+        self._trials = 0
+        self._trial_successes = 0
+        if state == self.CLOSED:
+            self._calls.clear()
+            self._failures = self._slow = self._bad = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        self._prune(time.monotonic())
+        calls = len(self._calls)
+        snapshot = {
+            'state': self.state,
+            'enabled': self.settings.enabled,
+            'calls_in_window': calls,
+            'failures_in_window': self._failures,
+            'slow_calls_in_window': self._slow,
+            'failure_rate': round(self._bad / calls, 3) if calls else 0.0,
+            'opened_count': self.opened_count,
+            'rejected': self.rejected,
+        }
+        if self.state == self.OPEN:
+            elapsed = time.monotonic() - self._opened_at
+            snapshot['retry_in'] = round(max(self.settings.open_seconds - elapsed, 0.0), 3)
+        return snapshot
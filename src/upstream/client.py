@@ -0,0 +1,177 @@
+import logging
+import time
+from dataclasses import dataclass
+from importlib.util import find_spec
+from typing import Any, Dict, Optional
+
+import httpx
+
+from src.config import BreakerConfig, HedgingConfig, HttpClientConfig
+from src.metrics import upstream_latency, upstream_errors, record_phase
+from .breaker import CircuitBreaker, CircuitOpenError
+from .hedging import Hedger
+
+logger = logging.getLogger('gateway')
+
+
+@dataclass
+class PoolStats:
+    """ Счётчики переиспользования соединений апстрима """
+    requests: int = 0
+    connections_opened: int = 0
+    connect_failures: int = 0
+
+    @property
+    def connections_reused(self) -> int:
+        return max(self.requests - self.connections_opened - self.connect_failures, 0)
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            'requests': self.requests,
+            'connections_opened': self.connections_opened,
+            'connections_reused': self.connections_reused,
+            'connect_failures': self.connect_failures,
+        }
+
+
+class Upstream:
+    """
+    Долгоживущий клиент с пулом keep-alive соединений к одному апстриму.
+    Создаётся и закрывается в lifespan приложения (см. src/main.py).
+    Каждый вызов проходит через автомат размыкания цепи апстрима;
+    GET-запросы при включённом хеджировании идут через Hedger.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            base_url: str,
+            settings: HttpClientConfig,
+            breaker: Optional[BreakerConfig] = None,
+            hedging: Optional[HedgingConfig] = None
+    ):
+        self.name = name
+        self.base_url = base_url
+        self.settings = settings
+        self.stats = PoolStats()
+        self.breaker = CircuitBreaker(name, breaker or BreakerConfig(enabled=False))
+        self.hedger = Hedger(name, hedging or HedgingConfig())
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            raise RuntimeError(f'Upstream {self.name!r} is not started')
+        return self._client
+
+    async def start(self) -> None:
+        if self._client is not None:
+            return
+
+        http2 = self.settings.http2
+        if http2 and find_spec('h2') is None:
+            logger.warning(f'HTTP/2 requested for {self.name}, but h2 is not installed; using HTTP/1.1')
+            http2 = False
+
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=http2,
+            timeout=httpx.Timeout(
+                self.settings.timeout, connect=self.settings.connect_timeout
+            ),
+            limits=httpx.Limits(
+                max_connections=self.settings.max_connections,
+                max_keepalive_connections=self.settings.max_keepalive_connections,
+                keepalive_expiry=self.settings.keepalive_expiry,
+            ),
+        )
+        logger.info(f'Upstream {self.name} started: {self.base_url} (http2={http2})')
+
+    async def close(self) -> None:
+        if self._client is None:
+            return
+        client, self._client = self._client, None
+        await client.aclose()
+        logger.info(f'Upstream {self.name} closed: {self.stats.as_dict()}')
+
+    async def request(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        extensions = dict(kwargs.pop('extensions', None) or {})
+        extensions.setdefault('trace', self._trace)
+        return await self._dispatch(method, url, extensions, kwargs, stream=False)
+
+    async def stream(self, method: str, url: str, **kwargs: Any) -> httpx.Response:
+        """
+        Открывает ответ без чтения тела. Вызывающий обязан прочитать
+        или закрыть его (`aread()` / `aiter_bytes()` / `aclose()`).
+        """
+        extensions = dict(kwargs.pop('extensions', None) or {})
+        extensions.setdefault('trace', self._trace)
+        return await self._dispatch(method, url, extensions, kwargs, stream=True)
+
+    async def _dispatch(
+            self,
+            method: str,
+            url: str,
+            extensions: Dict[str, Any],
+            kwargs: Dict[str, Any],
+            stream: bool
+    ) -> httpx.Response:
+        def attempt():
+            request = self.client.build_request(method, url, extensions=extensions, **kwargs)
+            return self._send(request, stream=stream)
+
+        # Хеджировать и повторять можно только идемпотентные запросы
+        if method.upper() == 'GET' and self.hedger.enabled:
+            return await self.hedger.run(attempt)
+        return await attempt()
+
+    async def _send(self, request: httpx.Request, stream: bool) -> httpx.Response:
+        """
+        Отправляет запрос, если цепь не разомкнута (иначе CircuitOpenError),
+        и сообщает автомату исход: ошибка сети или 5xx — неудача.
+        Для потокового ответа учитывается время до заголовков.
+        """
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            upstream_errors.inc(self.name, 'circuit_open')
+            raise
+
+        self.stats.requests += 1
+        started = time.monotonic()
+        ok = None
+        try:
+            response = await self.client.send(request, stream=stream)
+            ok = response.status_code < 500
+            if not ok:
+                upstream_errors.inc(self.name, '5xx')
+            return response
+        except httpx.TransportError:
+            ok = False
+            upstream_errors.inc(self.name, 'transport')
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            self.breaker.record(ok, elapsed)
+            if ok is not None:
+                upstream_latency.observe(elapsed, self.name, request.method)
+                record_phase('upstream', elapsed)
+
+    async def get(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request('POST', url, **kwargs)
+
+    async def put(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request('PUT', url, **kwargs)
+
+    async def delete(self, url: str, **kwargs: Any) -> httpx.Response:
+        return await self.request('DELETE', url, **kwargs)
+
+    async def _trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        """ Хук httpcore: считаем только реально открытые TCP-соединения """
+        if event_name == 'connection.connect_tcp.complete':
+            self.stats.connections_opened += 1
+        elif event_name == 'connection.connect_tcp.failed':
+            self.stats.connect_failures += 1
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from src.config import HedgingConfig
+
+logger = logging.getLogger('gateway')
+
+Attempt = Callable[[], Awaitable[httpx.Response]]
+
+
+class LatencyWindow:
+    """
+    Кольцевой буфер последних задержек апстрима. Перцентиль считается
+    по отсортированной копии, которая пересобирается раз в `resort_every`
+    замеров, а не на каждый запрос.
+    """
+
+    def __init__(self, size: int = 512, min_samples: int = 20, resort_every: int = 32):
+        self._samples: deque[float] = deque(maxlen=size)
+        self._sorted: List[float] = []
+        self._pending = 0
+        self.min_samples = min_samples
+        self.resort_every = resort_every
+
+    def add(self, latency: float) -> None:
+        self._samples.append(latency)
+        self._pending += 1
+
+    def percentile(self, q: float) -> Optional[float]:
+        """ q-й перцентиль (0–100) или None, пока замеров мало """
+        if len(self._samples) < self.min_samples:
+            return None
+        if self._pending >= self.resort_every or not self._sorted:
+            self._sorted = sorted(self._samples)
+            self._pending = 0
+        index = min(int(len(self._sorted) * q / 100), len(self._sorted) - 1)
+        return self._sorted[index]
+
+
+class RetryBudget:
+    """
+    Бюджет повторов: каждый исходный запрос пополняет его на `ratio`,
+    каждая дополнительная попытка (хедж или повтор) тратит единицу.
+    Так дополнительная нагрузка на апстрим не превышает `ratio`
+    от основной, не считая начального запаса `burst`.
+    """
+
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+
+    def deposit(self) -> None:
+        self.tokens = min(self.tokens + self.ratio, self.burst)
+
+    def withdraw(self) -> bool:
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+@dataclass
+class HedgeStats:
+    """ Счётчики дополнительных попыток """
+    requests: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    retries: int = 0
+    budget_exhausted: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            'requests': self.requests,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'retries': self.retries,
+            'budget_exhausted': self.budget_exhausted,
+        }
+
+
+def _failed(task: asyncio.Task) -> bool:
+    return task.exception() is not None or task.result().status_code >= 500
+
+
+def _discard(task: asyncio.Task) -> None:
+    """ Отменяет проигравшую попытку и закрывает ответ, если он всё же пришёл """
+
+    def close(done: asyncio.Task) -> None:
+        if not done.cancelled() and done.exception() is None:
+            asyncio.ensure_future(done.result().aclose())
+
+    task.cancel()
+    task.add_done_callback(close)
+
+
+class Hedger:
+    """
+    Хеджирование и повторы идемпотентных GET-запросов к апстриму.
+
+    Если первая попытка не ответила за перцентиль `percentile` недавних
+    задержек, отправляется вторая; побеждает первый успешный ответ.
+    Ошибки сети и ответы 5xx повторяются с экспоненциальной задержкой
+    со случайным разбросом. Все дополнительные попытки оплачиваются
+    из общего бюджета повторов.
+    """
+
+    def __init__(self, name: str, settings: HedgingConfig):
+        self.name = name
+        self.settings = settings
+        self.latency = LatencyWindow()
+        self.budget = RetryBudget(settings.budget_ratio, settings.budget_burst)
+        self.stats = HedgeStats()
+
+    @property
+    def enabled(self) -> bool:
+        return self.settings.enabled
+
+    def delay(self) -> float:
+        """ Через сколько секунд без ответа отправлять хедж """
+        observed = self.latency.percentile(self.settings.percentile)
+        if observed is None:
+            return self.settings.max_delay
+        return min(max(observed, self.settings.min_delay), self.settings.max_delay)
+
+    def backoff(self, retry: int) -> float:
+        """ Экспоненциальная задержка перед повтором с полным разбросом """
+        ceiling = min(self.settings.backoff_cap, self.settings.backoff_base * 2 ** (retry - 1))
+        return random.uniform(0, ceiling)
+
+    def _spend(self) -> bool:
+        if self.budget.withdraw():
+            return True
+        self.stats.budget_exhausted += 1
+        return False
+
+    async def run(self, attempt: Attempt) -> httpx.Response:
+        """ Выполняет запрос с хеджированием и повторами в пределах бюджета """
+        self.stats.requests += 1
+        self.budget.deposit()
+
+        retry = 0
+        while True:
+            response, error = None, None
+            try:
+                response = await self._race(attempt)
+            except httpx.TransportError as e:
+                error = e
+
+            if response is not None and response.status_code < 500:
+                return response
+            if retry >= self.settings.max_retries or not self._spend():
+                if response is not None:
+                    return response
+                raise error
+
+            if response is not None:
+                await response.aclose()
+            retry += 1
+            self.stats.retries += 1
+            await asyncio.sleep(self.backoff(retry))
+
+    async def _race(self, attempt: Attempt) -> httpx.Response:
+        primary = asyncio.create_task(self._timed(attempt))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.delay())
+        except asyncio.CancelledError:
+            _discard(primary)
+            raise
+        if done or not self._spend():
+            return await primary
+
+        self.stats.hedges += 1
+        hedge = asyncio.create_task(self._timed(attempt))
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if not _failed(task)), None)
+                if winner is not None:
+                    if winner is hedge:
+                        self.stats.hedge_wins += 1
+                    for task in (primary, hedge):
+                        if task is not winner:
+                            _discard(task)
+                    return winner.result()
+
+            # Обе попытки неудачны — отдаём исход исходной, закрыв ответ хеджа
+            _discard(hedge)
+            return primary.result()
+        except asyncio.CancelledError:
+            _discard(primary)
+            _discard(hedge)
+            raise
+
+    async def _timed(self, attempt: Attempt) -> httpx.Response:
+        started = time.monotonic()
+        response = await attempt()
+        if response.status_code < 500:
+            self.latency.add(time.monotonic() - started)
+        return response
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'enabled': self.enabled,
+            'delay': round(self.delay(), 4),
+            'budget': round(self.budget.tokens, 2),
+            **self.stats.as_dict(),
+        }